@@ -1,36 +1,77 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, g
 import os
 import uuid
-import tempfile
 from dotenv import load_dotenv
 from flask_cors import CORS
-from utils.file_ops import save_uploaded_file, clone_github_repo, extract_zip, create_session_zip
-from utils.language_detect import detect_languages_in_dir, save_language_map
-from utils.linter import run_linters_on_dir, save_linter_results
-from utils.rag import run_rag_on_linter_results, save_rag_context
-from utils.ai_review import run_ai_review_on_rag, save_ai_log
-from utils.patch import generate_pr_comments, generate_patch_file, calculate_code_quality_score, save_report, save_patch_file
 import json
-from utils.session import set_session_status, get_session_status
+import gzip
+import hashlib
+import time
 
+# Load .env before importing utils so module-level settings pick it up
 load_dotenv()
+
+from utils.session import set_session_status, get_session_status, session_manager, SESSIONS_DIR, FINISHED_STATUSES
+from utils.jobs import enqueue_job, start_workers
+from utils.pipeline import restore_submission
+from utils.file_ops import plan_zip_extraction, ZipRejected
+from utils.ai_review import load_ai_log
+from utils.rag import get_retriever
+from utils.repo_mirror import is_allowed_repo_url
+from utils.results_store import submission_key, resolve_alias, attach_submission, release_submission
+from utils.manifest import load_manifest
+from utils.file_ops import stream_session_zip, SESSION_PACKAGES
+from utils.lint_cache import file_hash
+from utils.events import follow_events, valid_offset
+from utils.results_db import RESULTS_DB, REVIEW_PAGE_SIZE, query_findings, read_summary
+from utils.admission import client_id, check_admission, estimate_github_files, AdmissionRejected
+from utils.cancellation import cancel_job
+from utils.shared_state import get_state_backend
+from utils import metrics
+
 app = Flask(__name__)
 CORS(app)
 
-UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'ai_code_reviewer_sessions')
+UPLOAD_FOLDER = SESSIONS_DIR
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # ALLOWED_EXTENSIONS = {'.py', '.js', '.java', '.c', '.cpp', '.txt', '.md'}
-MAX_ZIP_SIZE_MB = int(os.getenv('MAX_ZIP_SIZE_MB', 5))
+MAX_ZIP_SIZE_MB = int(os.getenv('MAX_ZIP_SIZE_MB', 50))
 MAX_ZIP_SIZE = MAX_ZIP_SIZE_MB * 1024 * 1024
 
 print("MAX_ZIP_SIZE_MB =", MAX_ZIP_SIZE_MB)
 
+# Build the best-practice index before the first job needs it
+get_retriever()
+session_manager.load()
+session_manager.start()
+start_workers()
+
 def allowed_file(filename):
     return True  # Accept any file extension
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # Streamed responses (/stream, /download) are timed up to their headers
+    if 'request_start' in g:
+        metrics.registry.observe('review_http_request_seconds', time.perf_counter() - g.request_start,
+                                 endpoint=request.endpoint or 'unknown', method=request.method, status=response.status_code)
+    return response
+
 @app.route('/submit', methods=['POST'])
 def submit():
+    # Admission runs before the upload is parsed, so a rejected client never costs us the body
+    client = client_id(request)
+    try:
+        check_admission(client)
+    except AdmissionRejected as e:
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
     session_id = str(uuid.uuid4())
     session_dir = os.path.join(UPLOAD_FOLDER, session_id)
     os.makedirs(session_dir, exist_ok=True)
@@ -39,6 +80,7 @@ def submit():
     MAX_SAFE_ZIP_SIZE = 900 * 1024 * 1024  # 900MB
 
     try:
+        job = {'session_id': session_id, 'session_dir': session_dir, 'client': client}
         # Handle code paste
         if 'code' in request.form:
             code = request.form['code']
@@ -48,33 +90,12 @@ def submit():
                 return jsonify({'error': 'Invalid file type for pasted code.'}), 400
             with open(os.path.join(session_dir, filename), 'w', encoding='utf-8') as f:
                 f.write(code)
-            # Language detection
-            lang_map = detect_languages_in_dir(session_dir)
-            save_language_map(session_dir, lang_map)
-            # Linter integration
-            linter_results = run_linters_on_dir(session_dir, lang_map)
-            save_linter_results(session_dir, linter_results)
-            # RAG integration
-            rag_context = run_rag_on_linter_results(session_dir, lang_map, linter_results)
-            save_rag_context(session_dir, rag_context)
-            # AI review integration
-            ai_results = run_ai_review_on_rag(session_dir, lang_map, rag_context)
-            save_ai_log(session_dir, ai_results)
-            # Patch/report generation
-            with open(os.path.join(session_dir, 'linter_results.json'), 'r', encoding='utf-8') as f:
-                linter_results = json.load(f)
-            pr_comments = generate_pr_comments(ai_results)
-            patch_content = generate_patch_file(ai_results)
-            score = calculate_code_quality_score(linter_results, ai_results)
-            save_report(session_dir, pr_comments, score)
-            save_patch_file(session_dir, patch_content)
-            # ZIP packaging
-            zip_path = create_session_zip(session_dir)
-            set_session_status(session_dir, 'complete', {'download_url': f'/download/{session_id}'})
-            return jsonify({'session_id': session_id, 'status': 'submitted', 'type': 'paste'})
+            job['type'] = 'paste'
+            job['estimated_files'] = 1
+            job['submission_key'] = submission_key('paste', filename, code)
 
         # Handle ZIP upload
-        if 'zip' in request.files:
+        elif 'zip' in request.files:
             zip_file = request.files['zip']
             if zip_file.filename == '' or not zip_file.filename.endswith('.zip'):
                 set_session_status(session_dir, 'error', {'error': 'Invalid ZIP file.'})
@@ -88,88 +109,55 @@ def submit():
             if size > MAX_ZIP_SIZE:
                 set_session_status(session_dir, 'error', {'error': f'ZIP file too large (max {MAX_ZIP_SIZE_MB}MB).'})
                 return jsonify({'error': f'ZIP file too large (max {MAX_ZIP_SIZE_MB}MB).'}), 400
+            # Central-directory check: reject bombs and dependency-only archives before saving anything
+            try:
+                selected, _ = plan_zip_extraction(zip_file.stream)
+            except ZipRejected as e:
+                set_session_status(session_dir, 'error', {'error': str(e)})
+                return jsonify({'error': str(e)}), 400
+            zip_file.stream.seek(0)
             zip_path = os.path.join(session_dir, zip_file.filename)
             zip_file.save(zip_path)
-            extracted, skipped = extract_zip(zip_path, session_dir)
-            if not extracted:
-                set_session_status(session_dir, 'error', {'error': 'No files could be extracted from the ZIP. The archive may be empty, corrupted, or all files were skipped due to errors.'})
-                return jsonify({'error': 'No files could be extracted from the ZIP. The archive may be empty, corrupted, or all files were skipped due to errors.'}), 400
-            # Language detection
-            lang_map = detect_languages_in_dir(session_dir)
-            import logging
-            logging.warning(f"Detected files and languages: {lang_map}")
-            from utils.linter import SUPPORTED_LANGUAGES
-            SKIP_DIRS = {'node_modules', '.git', 'dist', 'build', 'venv', '__pycache__', '.venv', '.mypy_cache', '.pytest_cache'}
-            def is_supported_code_file(rel_path, lang):
-                parts = rel_path.split(os.sep)
-                if any(part in SKIP_DIRS for part in parts):
-                    return False
-                return lang in SUPPORTED_LANGUAGES
-            code_files = [f for f, lang in lang_map.items() if is_supported_code_file(f, lang)]
-            if not code_files:
-                set_session_status(session_dir, 'error', {'error': 'No supported code files found in the ZIP. The archive may only contain dependencies or unsupported files.'})
-                return jsonify({'error': 'No supported code files found in the ZIP. The archive may only contain dependencies or unsupported files.'}), 400
-            save_language_map(session_dir, lang_map)
-            # Linter integration
-            linter_results = run_linters_on_dir(session_dir, lang_map)
-            save_linter_results(session_dir, linter_results)
-            # RAG integration
-            rag_context = run_rag_on_linter_results(session_dir, lang_map, linter_results)
-            save_rag_context(session_dir, rag_context)
-            # AI review integration
-            ai_results = run_ai_review_on_rag(session_dir, lang_map, rag_context)
-            save_ai_log(session_dir, ai_results)
-            # Patch/report generation
-            with open(os.path.join(session_dir, 'linter_results.json'), 'r', encoding='utf-8') as f:
-                linter_results = json.load(f)
-            pr_comments = generate_pr_comments(ai_results)
-            patch_content = generate_patch_file(ai_results)
-            score = calculate_code_quality_score(linter_results, ai_results)
-            save_report(session_dir, pr_comments, score)
-            save_patch_file(session_dir, patch_content)
-            # ZIP packaging
-            zip_path = create_session_zip(session_dir)
-            set_session_status(session_dir, 'complete', {'download_url': f'/download/{session_id}'})
-            return jsonify({'session_id': session_id, 'status': 'submitted', 'type': 'zip'})
+            metrics.registry.inc('review_upload_bytes_total', size)
+            job['type'] = 'zip'
+            job['zip_path'] = zip_path
+            job['estimated_files'] = len(selected)
+            job['submission_key'] = submission_key('zip', file_hash(zip_path))
 
         # Handle GitHub repo URL
-        if 'github_url' in request.form:
+        elif 'github_url' in request.form:
             github_url = request.form['github_url']
-            if not github_url.startswith('https://github.com/'):
+            if not is_allowed_repo_url(github_url):
                 set_session_status(session_dir, 'error', {'error': 'Only public GitHub repos allowed.'})
                 return jsonify({'error': 'Only public GitHub repos allowed.'}), 400
-            try:
-                clone_github_repo(github_url, session_dir)
-            except Exception as e:
-                set_session_status(session_dir, 'error', {'error': f'GitHub clone failed: {str(e)}'})
-                return jsonify({'error': f'GitHub clone failed: {str(e)}'}), 400
-            # Language detection
-            lang_map = detect_languages_in_dir(session_dir)
-            save_language_map(session_dir, lang_map)
-            # Linter integration
-            linter_results = run_linters_on_dir(session_dir, lang_map)
-            save_linter_results(session_dir, linter_results)
-            # RAG integration
-            rag_context = run_rag_on_linter_results(session_dir, lang_map, linter_results)
-            save_rag_context(session_dir, rag_context)
-            # AI review integration
-            ai_results = run_ai_review_on_rag(session_dir, lang_map, rag_context)
-            save_ai_log(session_dir, ai_results)
-            # Patch/report generation
-            with open(os.path.join(session_dir, 'linter_results.json'), 'r', encoding='utf-8') as f:
-                linter_results = json.load(f)
-            pr_comments = generate_pr_comments(ai_results)
-            patch_content = generate_patch_file(ai_results)
-            score = calculate_code_quality_score(linter_results, ai_results)
-            save_report(session_dir, pr_comments, score)
-            save_patch_file(session_dir, patch_content)
-            # ZIP packaging
-            zip_path = create_session_zip(session_dir)
-            set_session_status(session_dir, 'complete', {'download_url': f'/download/{session_id}'})
-            return jsonify({'session_id': session_id, 'status': 'submitted', 'type': 'github'})
-
-        set_session_status(session_dir, 'error', {'error': 'No valid input provided.'})
-        return jsonify({'error': 'No valid input provided.'}), 400
+            job['type'] = 'github'
+            job['github_url'] = github_url
+            job['estimated_files'] = estimate_github_files(github_url)
+
+        else:
+            set_session_status(session_dir, 'error', {'error': 'No valid input provided.'})
+            return jsonify({'error': 'No valid input provided.'}), 400
+
+        if job.get('submission_key'):
+            # Repeat of a finished submission: answer from the results store without queueing
+            stored_key = resolve_alias(job['submission_key'])
+            if stored_key and restore_submission(session_dir, job, stored_key):
+                set_session_status(session_dir, 'complete', {'results_store': 'hit', 'download_url': f'/download/{session_id}'})
+                return jsonify({'session_id': session_id, 'status': 'complete', 'type': job['type']})
+            # Same submission still running (double-click, CI retry): hand back that session
+            running = attach_submission(job['submission_key'], session_id)
+            running_status = get_session_status(os.path.join(UPLOAD_FOLDER, running)).get('status') if running else None
+            if running_status in FINISHED_STATUSES or running_status == 'not found':
+                # Finished in a worker process, which can't clear this process's registry, or already deleted
+                release_submission(job['submission_key'])
+                running = attach_submission(job['submission_key'], session_id)
+            if running:
+                session_manager.remove(session_dir)
+                return jsonify({'session_id': running, 'status': 'queued', 'type': job['type'], 'attached': True}), 202
+
+        # The pipeline runs on the worker pool; poll /status/<session_id> for progress
+        enqueue_job(job)
+        return jsonify({'session_id': session_id, 'status': 'queued', 'type': job['type']}), 202
 
     except Exception as e:
         import traceback
@@ -180,7 +168,66 @@ def submit():
 def status(session_id):
     session_dir = os.path.join(UPLOAD_FOLDER, session_id)
     status = get_session_status(session_dir)
-    return jsonify({'session_id': session_id, **status})
+    session_manager.touch(session_dir)
+    return jsonify({'session_id': session_id, **status, **(session_manager.usage(session_dir) or {})})
+
+@app.route('/session/<session_id>', methods=['DELETE'])
+def cancel_session(session_id):
+    session_dir = os.path.join(UPLOAD_FOLDER, session_id)
+    status = get_session_status(session_dir).get('status')
+    if status == 'not found':
+        return jsonify({'error': 'Session not found.'}), 404
+    if status not in FINISHED_STATUSES:
+        set_session_status(session_dir, 'cancelled')
+    # A running job is stopped by its worker (here or in another process), which then removes the session
+    if cancel_job(session_id):
+        return jsonify({'session_id': session_id, 'status': 'cancelling'}), 202
+    state, job = get_state_backend().cancel(session_id)
+    if state == 'running':
+        return jsonify({'session_id': session_id, 'status': 'cancelling'}), 202
+    # A dropped job never reaches a worker, so nobody else frees its submission for identical ones
+    if job and job.get('submission_key'):
+        release_submission(job['submission_key'])
+    session_manager.remove(session_dir)
+    return jsonify({'session_id': session_id, 'status': 'cancelled'})
+
+@app.route('/stream/<session_id>', methods=['GET'])
+def stream(session_id):
+    # Server-sent events by default, newline-delimited JSON with ?format=ndjson.
+    # Event ids are byte offsets, so a reconnect with Last-Event-ID resumes where it left off.
+    session_dir = os.path.join(UPLOAD_FOLDER, session_id)
+    if not os.path.isdir(session_dir):
+        return jsonify({'error': 'Session not found.'}), 404
+    session_manager.touch(session_dir)
+    offset = request.headers.get('Last-Event-ID') or request.args.get('offset', '0')
+    if not offset.isdigit() or not valid_offset(session_dir, int(offset)):
+        return jsonify({'error': 'Invalid event offset.'}), 400
+    offset = int(offset)
+    ndjson = request.args.get('format') == 'ndjson'
+
+    def finished():
+        return get_session_status(session_dir).get('status') in FINISHED_STATUSES
+
+    def generate():
+        for event_offset, event in follow_events(session_dir, offset, finished=finished):
+            if ndjson:
+                yield json.dumps({'id': event_offset, **event}) + '\n'
+            else:
+                yield f"id: {event_offset}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    mimetype = 'application/x-ndjson' if ndjson else 'text/event-stream'
+    return Response(generate(), mimetype=mimetype, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Counters and histograms cover jobs run by this process; dedicated workers (worker.py) expose their own
+    backend = get_state_backend()
+    gauges = {
+        'review_queue_depth': ('Jobs waiting for a worker.', [({}, backend.depth())]),
+        'review_active_jobs': ('Jobs queued or running.', [({}, backend.active_jobs())]),
+        'review_sessions_disk_bytes': ('Disk used by session directories.', [({}, session_manager.total_bytes())]),
+    }
+    return Response(metrics.registry.render(gauges), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/config', methods=['GET'])
 def config():
@@ -192,19 +239,97 @@ def config():
 @app.route('/download/<session_id>', methods=['GET'])
 def download(session_id):
     session_dir = os.path.join(UPLOAD_FOLDER, session_id)
-    zip_path = os.path.join(session_dir, 'session_package.zip')
-    if not os.path.exists(zip_path):
+    # ?contents=artifacts leaves out the submitted sources
+    contents = request.args.get('contents', 'all')
+    if contents not in SESSION_PACKAGES:
+        return jsonify({'error': f"contents must be one of: {', '.join(SESSION_PACKAGES)}"}), 400
+    if get_session_status(session_dir).get('status') != 'complete':
         return jsonify({'error': 'ZIP package not found.'}), 404
-    return send_file(zip_path, as_attachment=True)
+    # A first download adds the cached package to the session's size
+    session_manager.touch(session_dir, resized=True)
+    zip_name = SESSION_PACKAGES[contents]
+    zip_path = os.path.join(session_dir, zip_name)
+    if os.path.exists(zip_path):
+        return send_file(zip_path, as_attachment=True)
+    stream = stream_session_zip(session_dir, manifest=load_manifest(session_dir),
+                                include_sources=contents == 'all', cache_path=zip_path)
+    return Response(stream, mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={zip_name}'})
+
+REVIEW_QUERY_PARAMS = ('offset', 'limit', 'kind', 'file', 'severity', 'language', 'fields')
+GZIP_MIN_BYTES = int(os.getenv('GZIP_MIN_BYTES', 1024))
+
+def _report_summary(report_path):
+    # Fallback for sessions packaged before results.db existed
+    code_quality_score = None
+    with open(report_path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    for line in lines:
+        if line.strip().startswith('## Code Quality Score:'):
+            try:
+                code_quality_score = int(line.split(':')[1].split('/')[0].strip())
+            except Exception:
+                code_quality_score = None
+    # Collect PR-style comments (after '## PR-Style Comments')
+    pr_section = False
+    pr_lines = []
+    for line in lines:
+        if line.strip().startswith('## PR-Style Comments'):
+            pr_section = True
+            continue
+        if pr_section:
+            pr_lines.append(line)
+    return {'code_quality_score': code_quality_score, 'pr_comments': ''.join(pr_lines).strip()}
+
+def _json_response(payload, etag=None):
+    body = json.dumps(payload).encode('utf-8')
+    headers = {'Vary': 'Accept-Encoding'}
+    if etag:
+        headers['ETag'] = etag
+    if len(body) > GZIP_MIN_BYTES and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body, mimetype='application/json', headers=headers)
 
 @app.route('/review/<session_id>', methods=['GET'])
 def review(session_id):
     session_dir = os.path.join(UPLOAD_FOLDER, session_id)
+    results_db = os.path.join(session_dir, RESULTS_DB)
     ai_log_path = os.path.join(session_dir, 'ai_log.json')
     linter_path = os.path.join(session_dir, 'linter_results.json')
     patch_path = os.path.join(session_dir, 'patch.diff')
     report_path = os.path.join(session_dir, 'review_report.md')
     download_url = f'/download/{session_id}'
+    session_manager.touch(session_dir)
+    etag = None
+    if os.path.exists(results_db):
+        # Results are immutable once written, so the db file identity plus the query is a stable validator
+        st = os.stat(results_db)
+        query = request.query_string.decode('utf-8', 'replace')
+        etag = '"' + hashlib.sha1(f'{st.st_mtime_ns}:{st.st_size}:{query}'.encode()).hexdigest() + '"'
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers={'ETag': etag, 'Vary': 'Accept-Encoding'})
+
+    if any(name in request.args for name in REVIEW_QUERY_PARAMS):
+        if not os.path.exists(results_db):
+            return jsonify({'error': 'Structured results not available for this session'}), 404
+        kind = request.args.get('kind', 'ai')
+        if kind not in ('ai', 'lint'):
+            return jsonify({'error': "kind must be 'ai' or 'lint'"}), 400
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            limit = max(1, int(request.args.get('limit', REVIEW_PAGE_SIZE)))
+        except ValueError:
+            return jsonify({'error': 'offset and limit must be integers'}), 400
+        fields = [name for name in request.args.get('fields', '').split(',') if name] or None
+        page = query_findings(session_dir, kind=kind, file=request.args.get('file'),
+                              severity=request.args.get('severity'), language=request.args.get('language'),
+                              offset=offset, limit=limit, fields=fields)
+        page['kind'] = kind
+        if page['offset'] + len(page['items']) < page['total']:
+            page['next_offset'] = page['offset'] + len(page['items'])
+        return _json_response(page, etag)
+
     # Load files if they exist
     ai_log = []
     linter_results = {}
@@ -212,41 +337,29 @@ def review(session_id):
     patch = ''
     pr_comments = ''
     if os.path.exists(ai_log_path):
-        with open(ai_log_path, 'r', encoding='utf-8') as f:
-            ai_log = json.load(f)
+        ai_log, _ = load_ai_log(session_dir)
     if os.path.exists(linter_path):
         with open(linter_path, 'r', encoding='utf-8') as f:
             linter_results = json.load(f)
-    if os.path.exists(report_path):
-        with open(report_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            for line in lines:
-                if line.strip().startswith('## Code Quality Score:'):
-                    try:
-                        code_quality_score = int(line.split(':')[1].split('/')[0].strip())
-                    except Exception:
-                        code_quality_score = None
-                # Collect PR-style comments (after '## PR-Style Comments')
-            pr_section = False
-            pr_lines = []
-            for line in lines:
-                if line.strip().startswith('## PR-Style Comments'):
-                    pr_section = True
-                    continue
-                if pr_section:
-                    pr_lines.append(line)
-            pr_comments = ''.join(pr_lines).strip()
+    if os.path.exists(results_db):
+        summary = read_summary(session_dir)
+        code_quality_score = summary.get('code_quality_score')
+        pr_comments = summary.get('pr_comments', '')
+    elif os.path.exists(report_path):
+        summary = _report_summary(report_path)
+        code_quality_score = summary['code_quality_score']
+        pr_comments = summary['pr_comments']
     if os.path.exists(patch_path):
         with open(patch_path, 'r', encoding='utf-8') as f:
             patch = f.read()
-    return jsonify({
+    return _json_response({
         'ai_log': ai_log,
         'linter_results': linter_results,
         'code_quality_score': code_quality_score,
         'patch': patch,
         'download_url': download_url,
         'pr_comments': pr_comments
-    })
+    }, etag)
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
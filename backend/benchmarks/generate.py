@@ -0,0 +1,142 @@
+import io
+import os
+import random
+import zipfile
+import argparse
+import subprocess
+
+# Each template carries deliberate lint violations (unused imports, spacing, == None, var, ==)
+PYTHON_TEMPLATE = '''import os
+import sys
+import json
+
+
+def {name}(items, limit = 10):
+    result=[]
+    for item in items:
+        if item == None:
+            continue
+        result.append( item * {n} )
+    unused_{n} = json.dumps(result)
+    return result[:limit]
+
+
+class {cls}:
+    def __init__(self, value):
+        self.value=value
+
+    def compute(self, other):
+        if other == None: return self.value
+        return self.value + other  # a deliberately long line that keeps going past the flake8 default limit of 79 chars
+'''
+
+JAVASCRIPT_TEMPLATE = '''var unused{n} = require('fs');
+
+function {name}(items, limit) {{
+  var result = [];
+  for (var i = 0; i < items.length; i++) {{
+    if (items[i] == null) continue;
+    result.push(items[i] * {n});
+  }}
+  return result.slice(0, limit)
+}}
+
+module.exports = {{ {name}: {name} }};
+'''
+
+C_TEMPLATE = '''#include <stdio.h>
+#include <stdlib.h>
+
+int {name}(int *items, int count) {{
+    int *copy = malloc(sizeof(int) * count);
+    int total = 0;
+    for (int i = 0; i < count; i++) {{
+        copy[i] = items[i] * {n};
+        total += copy[i];
+    }}
+    return total;
+}}
+'''
+
+TEMPLATES = {
+    'Python': ('.py', PYTHON_TEMPLATE),
+    'JavaScript': ('.js', JAVASCRIPT_TEMPLATE),
+    'C': ('.c', C_TEMPLATE),
+}
+
+def parse_mix(spec):
+    # "Python=3,JavaScript=1" -> {'Python': 0.75, 'JavaScript': 0.25}
+    weights = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in TEMPLATES:
+            raise ValueError(f'Unknown language {name!r}; choose from {", ".join(TEMPLATES)}')
+        weights[name.strip()] = float(weight or 1)
+    total = sum(weights.values())
+    return {name: weight / total for name, weight in weights.items()}
+
+def generate_files(files=50, mix='Python=1', seed=0, repeat=1):
+    # {rel_path: content}; repeat stacks the template to grow file length without adding files
+    rng = random.Random(seed)
+    weights = parse_mix(mix)
+    languages = list(weights)
+    tree = {}
+    for i in range(files):
+        language = rng.choices(languages, weights=[weights[name] for name in languages])[0]
+        ext, template = TEMPLATES[language]
+        depth = rng.randint(0, 3)
+        folder = '/'.join(f'pkg{rng.randint(0, 4)}' for _ in range(depth))
+        rel_path = f'{folder}/module_{i}{ext}' if folder else f'module_{i}{ext}'
+        tree[rel_path] = ''.join(template.format(name=f'func_{i}_{r}', cls=f'Model{i}R{r}', n=i + r)
+                                 for r in range(repeat))
+    # Noise every real upload has: vendored dependencies and a binary asset
+    tree['node_modules/left-pad/index.js'] = 'module.exports = function () {};\n'
+    tree['assets/logo.png'] = bytes(rng.getrandbits(8) for _ in range(2048))
+    return tree
+
+def write_tree(tree, directory):
+    for rel_path, content in tree.items():
+        path = os.path.join(directory, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content if isinstance(content, bytes) else content.encode('utf-8'))
+    return directory
+
+def as_paste(tree):
+    # The largest source file, which is what a paste of real code looks like
+    rel_path, content = max(((p, c) for p, c in tree.items() if isinstance(c, str)), key=lambda item: len(item[1]))
+    return os.path.basename(rel_path), content
+
+def as_zip(tree, root='project'):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for rel_path, content in sorted(tree.items()):
+            zipf.writestr(f'{root}/{rel_path}', content)
+    return buf.getvalue()
+
+def as_git_repo(tree, directory):
+    # A committed local repository; review it through a file:// URL with ALLOW_LOCAL_REPOS=1
+    write_tree(tree, directory)
+    git = ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@example.com', '-c', 'init.defaultBranch=main']
+    subprocess.run([*git, 'init', '-q', directory], check=True)
+    subprocess.run([*git, '-C', directory, 'add', '-A'], check=True)
+    subprocess.run([*git, '-C', directory, 'commit', '-q', '-m', 'Synthetic benchmark repo'], check=True)
+    return 'file://' + os.path.abspath(directory)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic repository with injected lint violations.')
+    parser.add_argument('output')
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--mix', default='Python=1', help='language weights, e.g. Python=3,JavaScript=1,C=1')
+    parser.add_argument('--repeat', type=int, default=1, help='template repetitions per file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=['dir', 'zip', 'git'], default='dir')
+    args = parser.parse_args()
+    tree = generate_files(args.files, args.mix, args.seed, args.repeat)
+    if args.format == 'zip':
+        with open(args.output, 'wb') as f:
+            f.write(as_zip(tree))
+    elif args.format == 'git':
+        print(as_git_repo(tree, args.output))
+    else:
+        write_tree(tree, args.output)
@@ -0,0 +1,300 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+# Run as `python -m benchmarks.run` or `python benchmarks/run.py` from backend/
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.generate import generate_files, write_tree, as_paste, as_zip, as_git_repo
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Timings only compare on the machine that recorded them, so the baseline lives outside the repo
+DEFAULT_BASELINE = os.getenv('BENCHMARK_BASELINE', os.path.join(tempfile.gettempdir(), 'ai_code_reviewer_cache', 'benchmark_baseline.json'))
+
+def configure_environment(workdir):
+    # Must run before anything under utils/ is imported: settings are read at import time.
+    # Caches are off so every run measures the work, not a lookup; nothing leaves the machine.
+    settings = {
+        'AI_REVIEW_BACKEND': 'mock',
+        'RETRIEVER_BACKEND': 'numpy',
+        'LINT_CACHE_ENABLED': '0',
+        'REVIEW_CACHE_ENABLED': '0',
+        'RESULTS_STORE_ENABLED': '0',
+        'GITHUB_INCREMENTAL': '0',
+        'ALLOW_LOCAL_REPOS': '1',
+        'JOB_BACKEND': 'memory',
+        'MAX_ACTIVE_PER_CLIENT': '1000',
+        'MAX_ACTIVE_JOBS': '1000',
+        'MAX_QUEUE_DEPTH': '1000',
+        'SESSIONS_DIR': os.path.join(workdir, 'sessions'),
+        'REPO_MIRROR_DIR': os.path.join(workdir, 'mirrors'),
+        'RESULTS_STORE_DIR': os.path.join(workdir, 'results'),
+        'LINT_CACHE_DIR': os.path.join(workdir, 'lint_cache'),
+        'REVIEW_CACHE_DIR': os.path.join(workdir, 'review_cache'),
+        'JOB_DB_PATH': os.path.join(workdir, 'jobs.db'),
+    }
+    for name, value in settings.items():
+        os.environ[name] = value
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+class StageTimer:
+    # Wall time and peak Python allocation per stage; files/sec is over the files the run reviews
+    def __init__(self, files, trace_memory=True):
+        self.files = files
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def run(self, name, fn, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            stage = {'seconds': round(seconds, 4), 'files_per_sec': round(self.files / seconds, 1) if seconds else None}
+            if self.trace_memory:
+                stage['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+                tracemalloc.stop()
+            self.stages[name] = stage
+
+def bench_stages(tree, workdir, trace_memory=True):
+    # Each pipeline stage called directly on one session directory, in pipeline order
+    from utils.manifest import build_manifest, save_manifest, supported_files
+    from utils.language_detect import detect_languages_in_dir, save_language_map
+    from utils.linter import run_linters_on_dir, save_linter_results
+    from utils.rag import run_rag_on_linter_results, save_rag_context, get_retriever
+    from utils.ai_review import run_ai_review_on_rag, save_ai_log
+    from utils.patch import generate_pr_comments, write_patch_file, calculate_code_quality_score, save_report
+    from utils.results_db import write_results_db
+    from utils.file_ops import stream_session_zip
+    from utils.file_reader import SessionFiles
+
+    session_dir = write_tree(tree, os.path.join(workdir, 'stages'))
+    get_retriever()  # index build is a startup cost, not a per-review one
+    timer = StageTimer(0, trace_memory)
+    manifest = timer.run('manifest', build_manifest, session_dir)
+    save_manifest(session_dir, manifest)
+    timer.files = len(supported_files(manifest))
+    timer.stages['manifest']['files_per_sec'] = round(timer.files / timer.stages['manifest']['seconds'], 1)
+
+    lang_map = timer.run('detect_languages', detect_languages_in_dir, session_dir, manifest=manifest)
+    save_language_map(session_dir, lang_map)
+    linter_results = timer.run('lint', run_linters_on_dir, session_dir, lang_map, manifest=manifest)
+    save_linter_results(session_dir, linter_results)
+    with SessionFiles(session_dir) as files:
+        rag_context = timer.run('rag', run_rag_on_linter_results, session_dir, lang_map, linter_results, files=files)
+        save_rag_context(session_dir, rag_context)
+        ai_results = timer.run('ai_review', run_ai_review_on_rag, session_dir, lang_map, rag_context,
+                               manifest=manifest, files=files)
+        save_ai_log(session_dir, ai_results)
+
+        def report():
+            pr_comments = generate_pr_comments(ai_results)
+            score = calculate_code_quality_score(linter_results, ai_results)
+            save_report(session_dir, pr_comments, score)
+            write_patch_file(session_dir, ai_results, files=files)
+            write_results_db(session_dir, lang_map, linter_results, ai_results, score, pr_comments)
+        timer.run('report', report)
+
+    def package():
+        # The download package is streamed; draining it is what a /download costs
+        return sum(len(chunk) for chunk in stream_session_zip(session_dir, manifest))
+    package_bytes = timer.run('package', package)
+    return {
+        'files': timer.files,
+        'lint_issues': sum(len(issues) for issues in linter_results.values()),
+        'ai_findings': len(ai_results),
+        'package_bytes': package_bytes,
+        'stages': timer.stages,
+        'total_seconds': round(sum(stage['seconds'] for stage in timer.stages.values()), 4),
+    }
+
+def _wait_for_session(client, session_id, timeout):
+    # Polls /status and charges the time between status changes to the status being left
+    stages = {}
+    status, since = None, time.perf_counter()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = client.get(f'/status/{session_id}').get_json() or {}
+        now = time.perf_counter()
+        if data.get('status') != status:
+            if status is not None:
+                stages[status] = round(stages.get(status, 0) + now - since, 4)
+            status, since = data.get('status'), now
+        if status in ('complete', 'error', 'cancelled'):
+            return status, stages, data
+        time.sleep(0.01)
+    return 'timeout', stages, {}
+
+def bench_submit(tree, workdir, formats, timeout=600):
+    # The same trees through POST /submit on the Flask test client, one format after another
+    import app as app_module
+    client = app_module.app.test_client()
+    results = {}
+    files = sum(1 for rel_path, content in tree.items() if isinstance(content, str) and not rel_path.startswith('node_modules/'))
+    for fmt in formats:
+        if fmt == 'paste':
+            filename, code = as_paste(tree)
+            data, count = {'code': code, 'filename': filename}, 1
+        elif fmt == 'zip':
+            data, count = {'zip': (io.BytesIO(as_zip(tree)), 'project.zip')}, files
+        else:
+            repo_dir = os.path.join(workdir, 'git', 'project')
+            if not os.path.isdir(repo_dir):
+                as_git_repo(tree, repo_dir)
+            data, count = {'github_url': 'file://' + repo_dir}, files
+        start = time.perf_counter()
+        response = client.post('/submit', data=data, content_type='multipart/form-data')
+        body = response.get_json() or {}
+        if response.status_code not in (200, 202):
+            results[fmt] = {'status': 'rejected', 'error': body.get('error')}
+            continue
+        status, stages, final = _wait_for_session(client, body['session_id'], timeout)
+        download_start = time.perf_counter()
+        package_bytes = len(client.get(f"/download/{body['session_id']}").get_data()) if status == 'complete' else 0
+        end = time.perf_counter()
+        stages['download'] = round(end - download_start, 4)
+        results[fmt] = {
+            'status': status,
+            'error': final.get('error'),
+            'files': count,
+            'package_bytes': package_bytes,
+            'stages': {name: {'seconds': seconds} for name, seconds in stages.items()},
+            # The job's own breakdown from status.json; stages overlap, so these are informational
+            'timings': final.get('timings'),
+            'total_seconds': round(end - start, 4),
+            'files_per_sec': round(count / (end - start), 1),
+        }
+    return results
+
+def flatten_metrics(report):
+    # {'stages.lint.seconds': 1.2, 'submit.zip.total_seconds': 3.4, ...}; only the numbers a regression can show in
+    metrics = {}
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                walk(f'{prefix}.{key}' if prefix else key, child)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and prefix.rsplit('.', 1)[-1] in ('seconds', 'total_seconds', 'peak_mb', 'peak_rss_mb'):
+            metrics[prefix] = value
+    walk('', {key: report[key] for key in ('stages', 'submit', 'peak_rss_mb') if key in report})
+    return metrics
+
+def compare(report, baseline, threshold, min_seconds, min_mb):
+    # Slower or bigger than the baseline by more than threshold (and by more than the noise floor) is a regression
+    current = flatten_metrics(report)
+    previous = flatten_metrics(baseline)
+    rows = []
+    for name in sorted(set(current) & set(previous)):
+        now, before = current[name], previous[name]
+        floor = min_mb if name.endswith('mb') else min_seconds
+        change = (now - before) / before if before else 0.0
+        regressed = now - before > floor and change > threshold
+        rows.append({'metric': name, 'baseline': before, 'current': now, 'change': round(change, 3), 'regressed': regressed})
+    return rows
+
+def print_report(report):
+    print(f"{report['config']['files']} files ({report['config']['mix']}), {report['stages']['files']} reviewable")
+    print(f"{'stage':<28}{'seconds':>10}{'files/s':>10}{'peak MB':>10}")
+    for name, stage in report['stages']['stages'].items():
+        print(f"{name:<28}{stage['seconds']:>10.3f}{stage['files_per_sec'] or 0:>10.1f}{stage.get('peak_mb', 0):>10.2f}")
+    for fmt, result in report.get('submit', {}).items():
+        if result['status'] != 'complete':
+            print(f"submit[{fmt}]: {result['status']} {result.get('error') or ''}")
+            continue
+        print(f"submit[{fmt}]: {result['total_seconds']:.3f}s, {result['files_per_sec']} files/s")
+        for name, stage in result['stages'].items():
+            print(f"  {name:<26}{stage['seconds']:>10.3f}")
+    print(f"peak RSS: {report['peak_rss_mb']} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the review pipeline on a synthetic repository (offline, mock review backend).')
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--mix', default='Python=3,JavaScript=1,C=1')
+    parser.add_argument('--repeat', type=int, default=1, help='template repetitions per file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--submit', default='paste,zip,git', help='formats to send through /submit; empty to skip')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='skip per-stage peak memory (tracing slows stages down)')
+    parser.add_argument('--output', help='write the report as JSON')
+    parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE, help='compare against a baseline report')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help='write this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, as a fraction of the baseline')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='differences below this are noise')
+    parser.add_argument('--min-mb', type=float, default=5.0, help='memory differences below this are noise')
+    parser.add_argument('--keep', action='store_true', help='keep the working directory')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='review-bench-')
+    configure_environment(workdir)
+    try:
+        tree = generate_files(args.files, args.mix, args.seed, args.repeat)
+        report = {
+            'config': {'files': args.files, 'mix': args.mix, 'repeat': args.repeat, 'seed': args.seed},
+            'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+            'stages': bench_stages(tree, workdir, trace_memory=not args.no_tracemalloc),
+        }
+        formats = [fmt for fmt in args.submit.split(',') if fmt]
+        if formats:
+            report['submit'] = bench_submit(tree, workdir, formats)
+        report['peak_rss_mb'] = peak_rss_mb()
+    finally:
+        if args.keep:
+            print(f'Working directory kept at {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f'Baseline written to {args.save_baseline}')
+
+    failed = [result for result in report.get('submit', {}).values() if result['status'] != 'complete']
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            print(f'No baseline at {args.baseline}; record one on this machine with --save-baseline first', file=sys.stderr)
+            return 2
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config') != report['config']:
+            print(f"Baseline was recorded with {baseline.get('config')}; numbers are not comparable", file=sys.stderr)
+            return 2
+        if baseline.get('machine') != report['machine']:
+            print(f"Baseline was recorded on {baseline.get('machine')}; numbers are not comparable", file=sys.stderr)
+            return 2
+        rows = compare(report, baseline, args.threshold, args.min_seconds, args.min_mb)
+        regressions = [row for row in rows if row['regressed']]
+        for row in regressions:
+            print(f"REGRESSION {row['metric']}: {row['baseline']} -> {row['current']} (+{row['change']:.0%})")
+        if regressions:
+            return 1
+        print(f'No regressions beyond {args.threshold:.0%} against {args.baseline}')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
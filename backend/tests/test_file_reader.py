@@ -0,0 +1,38 @@
+from utils import file_reader
+from utils.file_reader import SessionFiles
+
+def write_files(directory, count, size):
+    for i in range(count):
+        (directory / f'f{i}.py').write_text(''.join(f'x{i} = {n}\n' for n in range(size)))
+
+def test_evicted_reader_stays_open_until_released(tmp_path, monkeypatch):
+    # Files big enough to be mapped, so a premature close would fail on the closed mmap
+    monkeypatch.setattr(file_reader, 'FILE_MMAP_MIN_BYTES', 0)
+    write_files(tmp_path, 3, 100)
+    files = SessionFiles(str(tmp_path), max_open=1)
+    with files.open('f0.py') as held:
+        with files.open('f1.py') as other:
+            assert other.line(1) == 'x1 = 0'
+        with files.open('f2.py'):
+            pass
+        # f0 was evicted twice over but its holder can still read it
+        assert held.line(100) == 'x0 = 99'
+    assert held._data.closed
+    files.close()
+
+def test_reopening_a_held_file_shares_the_reader(tmp_path):
+    write_files(tmp_path, 1, 3)
+    with SessionFiles(str(tmp_path)) as files:
+        with files.open('f0.py') as first, files.open('f0.py') as second:
+            assert first is second
+        with files.open('missing.py') as missing:
+            assert missing is None
+
+def test_close_defers_readers_still_held(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_reader, 'FILE_MMAP_MIN_BYTES', 0)
+    write_files(tmp_path, 1, 10)
+    files = SessionFiles(str(tmp_path))
+    with files.open('f0.py') as held:
+        files.close()
+        assert held.line(10) == 'x0 = 9'
+    assert held._data.closed
@@ -0,0 +1,35 @@
+import os
+import subprocess
+
+from utils.patch import write_patch_file
+
+SOURCE = 'import os\n\n\ndef f(x):\n    y=x+1\n    return y\n' + ''.join(f'# line {i}\n' for i in range(20)) + 'z=1\n'
+
+def entry(line, current, recommended):
+    return {'file': 'a.py', 'line': line, 'issue': {'line': line}, 'suggestion': '', 'current_code': current,
+            'recommended_code': recommended, 'patch': 'stale'}
+
+def test_entry_patches_are_the_hunks_in_patch_diff(tmp_path):
+    (tmp_path / 'a.py').write_text(SOURCE)
+    ai_log = [entry(5, 'y=x+1', 'y = x + 1'), entry(27, 'z=1', 'z = 1'),
+              entry(5, 'y=x+1', 'y = x+1'), entry(1, 'import os', 'import os')]
+    stats = write_patch_file(str(tmp_path), ai_log)
+    assert stats == {'files': 1, 'hunks': 2, 'rejected': 0}
+    patch = (tmp_path / 'patch.diff').read_text()
+    for applied in ai_log[:2]:
+        header, hunk = applied['patch'].split('@@', 1)
+        assert header == '--- a/a.py\n+++ b/a.py\n'
+        assert '@@' + hunk in patch
+    # A conflicting suggestion and an unchanged one have nothing to apply
+    assert ai_log[2]['patch'] == ai_log[3]['patch'] == ''
+    for applied in ai_log[:2]:
+        subprocess.run(['git', 'apply', '--check', '-'], input=applied['patch'], text=True, cwd=tmp_path, check=True)
+    subprocess.run(['git', 'apply', '--check', 'patch.diff'], cwd=tmp_path, check=True)
+
+def test_unchanged_code_leaves_patch_diff_empty(tmp_path):
+    (tmp_path / 'a.py').write_text(SOURCE)
+    ai_log = [entry(5, 'y=x+1', 'y=x+1')]
+    assert write_patch_file(str(tmp_path), ai_log) == {'files': 0, 'hunks': 0, 'rejected': 0}
+    assert (tmp_path / 'patch.diff').read_text() == ''
+    assert ai_log[0]['patch'] == ''
+    assert os.path.exists(tmp_path / 'patch.diff')
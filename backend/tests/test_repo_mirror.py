@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import subprocess
+
+import pytest
+
+from utils import repo_mirror, results_store, review_cache, lint_cache
+from utils.pipeline import run_review_pipeline
+from utils.session import get_session_status
+
+GIT = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', '-c', 'init.defaultBranch=main']
+
+def commit_files(repo_dir, files, message):
+    for rel_path, content in files.items():
+        path = os.path.join(repo_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+    subprocess.run([*GIT, '-C', repo_dir, 'add', '-A'], check=True)
+    subprocess.run([*GIT, '-C', repo_dir, 'commit', '-q', '-m', message], check=True)
+    return subprocess.run(['git', '-C', repo_dir, 'rev-parse', 'HEAD'], check=True, capture_output=True, text=True).stdout.strip()
+
+@pytest.fixture
+def local_repo(tmp_path, monkeypatch):
+    # A committed repository reviewed through file://, with every cross-session store off
+    monkeypatch.setattr(repo_mirror, 'MIRROR_DIR', str(tmp_path / 'mirrors'))
+    monkeypatch.setattr(repo_mirror, 'ALLOW_LOCAL_REPOS', True)
+    monkeypatch.setattr(results_store, 'RESULTS_STORE_ENABLED', False)
+    monkeypatch.setattr(review_cache, 'REVIEW_CACHE_ENABLED', False)
+    monkeypatch.setattr(lint_cache, 'LINT_CACHE_ENABLED', False)
+    repo_dir = str(tmp_path / 'repo')
+    subprocess.run([*GIT, 'init', '-q', repo_dir], check=True)
+    commit_files(repo_dir, {
+        'a.py': 'import os\n\n\ndef a(x):\n    return x==1\n',
+        'pkg/b.py': 'import sys\n\n\ndef b(y):\n    return y\n',
+        'pkg/c.py': 'def c(z = 1):\n    return z\n',
+    }, 'first')
+    return repo_dir
+
+def review(url, sessions_dir, name):
+    session_dir = os.path.join(sessions_dir, name)
+    os.makedirs(session_dir)
+    job = {'type': 'github', 'github_url': url}
+    run_review_pipeline(session_dir, name, job)
+    status = get_session_status(session_dir)
+    assert status['status'] == 'complete'
+    return job, status, session_dir
+
+def reviewed_refs(url):
+    output = subprocess.run(['git', '-C', repo_mirror._mirror_path(url), 'for-each-ref', '--format=%(refname)', 'refs/reviewed/'],
+                            check=True, capture_output=True, text=True).stdout
+    return {ref.rsplit('/', 1)[-1] for ref in output.split()}
+
+def test_second_review_carries_forward_unchanged_files(local_repo, tmp_path):
+    url = 'file://' + local_repo
+    sessions = str(tmp_path / 'sessions')
+    first_job, first_status, _ = review(url, sessions, 'first')
+    assert 'incremental' not in first_status
+
+    second_commit = commit_files(local_repo, {'pkg/b.py': 'import sys\n\n\ndef b(y):\n    return y+1\n',
+                                              'pkg/d.py': 'import json\n'}, 'second')
+    second_job, second_status, session_dir = review(url, sessions, 'second')
+    assert second_job['commit'] == second_commit
+    assert repo_mirror.changed_files(url, first_job['commit'], second_commit) == {os.path.join('pkg', 'b.py'), os.path.join('pkg', 'd.py')}
+    assert second_status['incremental'] == {'base_commit': first_job['commit'], 'changed_files': 2, 'carried_forward': 2}
+    with open(os.path.join(session_dir, 'linter_results.json'), 'r', encoding='utf-8') as f:
+        linter_results = json.load(f)
+    # Carried-forward and re-linted files together cover the whole tree
+    assert set(linter_results) == {'a.py', os.path.join('pkg', 'b.py'), os.path.join('pkg', 'c.py'), os.path.join('pkg', 'd.py')}
+    assert repo_mirror.last_review(url)['commit'] == second_commit
+
+def test_fetch_keeps_only_head_and_last_reviewed_ref(local_repo, tmp_path):
+    url = 'file://' + local_repo
+    sessions = str(tmp_path / 'sessions')
+    first_job, _, _ = review(url, sessions, 'first')
+    commit_files(local_repo, {'a.py': 'x = 1\n'}, 'second')
+    second_job, _, _ = review(url, sessions, 'second')
+    third_commit = commit_files(local_repo, {'a.py': 'x = 2\n'}, 'third')
+    assert repo_mirror.fetch_head(url) == third_commit
+    # The first review's commit is no longer needed by any diff
+    assert reviewed_refs(url) == {second_job['commit'], third_commit}
+
+def test_prune_mirrors_drops_expired_mirrors_and_their_index(local_repo, tmp_path, monkeypatch):
+    url = 'file://' + local_repo
+    review(url, str(tmp_path / 'sessions'), 'first')
+    old = time.time() - (repo_mirror.REPO_MIRROR_TTL_HOURS + 1) * 3600
+    os.utime(repo_mirror._mirror_path(url), (old, old))
+    repo_mirror.prune_mirrors(keep=repo_mirror.mirror_key(url))
+    assert os.path.isdir(repo_mirror._mirror_path(url))
+    repo_mirror.prune_mirrors()
+    assert not os.path.exists(repo_mirror._mirror_path(url))
+    assert repo_mirror.last_review(url) is None
+
+def test_only_github_and_opted_in_local_urls_are_allowed(local_repo, monkeypatch):
+    assert repo_mirror.is_allowed_repo_url('https://github.com/owner/repo')
+    assert repo_mirror.is_allowed_repo_url('file://' + local_repo)
+    assert not repo_mirror.is_allowed_repo_url('https://gitlab.com/owner/repo')
+    assert not repo_mirror.is_allowed_repo_url('ssh://git@github.com/owner/repo')
+    monkeypatch.setattr(repo_mirror, 'ALLOW_LOCAL_REPOS', False)
+    assert not repo_mirror.is_allowed_repo_url('file://' + local_repo)
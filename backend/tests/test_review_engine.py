@@ -0,0 +1,96 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.review_engine import ReviewEngine, HTTPReviewBackend, TokenBucket, PROMPT_VERSION
+
+class StubReviewServer:
+    # Local stand-in for the review service: records every request body and answers from a script
+    def __init__(self, replies=()):
+        self.requests = []
+        self.replies = list(replies)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.requests.append(body)
+                status, headers = stub.replies.pop(0) if stub.replies else (200, {})
+                payload = {'results': [{'suggestion': f"fix {item['linter_output']}", 'recommended_code': item['code'].strip()}
+                                       for item in body['items']]} if status == 200 else {}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/review'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def make_item(line, code, scope=None):
+    item = {'file': 'a.py', 'line': line, 'language': 'Python', 'issue': {'line': line, 'message': 'E225'},
+            'code': code, 'linter_output': f'E225 at {line}', 'best_practices': []}
+    if scope:
+        item['scope'] = scope
+    return item
+
+def make_engine(backend, **kwargs):
+    # No cache and an unlimited bucket, so every call reaches the stub right away
+    return ReviewEngine(backend, bucket=TokenBucket(0, 0), backoff=0, **kwargs)
+
+def test_packed_batches_post_shared_context_once():
+    scope = {'id': 'a.py:1-3', 'file': 'a.py', 'start_line': 1, 'end_line': 3, 'code': 'def f():\n    x=1\n    y=2', 'tokens': 12}
+    items = [make_item(2, '    x=1', scope), make_item(3, '    y=2', scope), make_item(9, 'z=3')]
+    token_stats = {}
+    with StubReviewServer() as stub:
+        records = make_engine(HTTPReviewBackend(stub.url), token_stats=token_stats).review_sync(items, batches=[[0, 1], [2]])
+    assert len(stub.requests) == 2
+    first = next(body for body in stub.requests if len(body['items']) == 2)
+    assert first['prompt_version'] == PROMPT_VERSION
+    assert first['contexts'] == [{key: scope[key] for key in ('id', 'file', 'start_line', 'end_line', 'code')}]
+    assert [item['context_id'] for item in first['items']] == ['a.py:1-3', 'a.py:1-3']
+    assert all('scope' not in item for item in first['items'])
+    # Results come back in item order whatever order the requests finished in
+    assert [record['line'] for record in records] == [2, 3, 9]
+    assert [record['recommended_code'] for record in records] == ['x=1', 'y=2', 'z=3']
+    assert records[0]['suggestion'] == 'fix E225 at 2'
+    assert token_stats['sent_tokens'] > 0
+
+def test_unpacked_items_are_one_request_each():
+    items = [make_item(1, 'a=1'), make_item(2, 'b=2'), make_item(3, 'c=3')]
+    with StubReviewServer() as stub:
+        records = make_engine(HTTPReviewBackend(stub.url)).review_sync(items)
+    assert sorted(len(body['items']) for body in stub.requests) == [1, 1, 1]
+    assert [record['current_code'] for record in records] == ['a=1', 'b=2', 'c=3']
+
+def test_retries_on_overload_then_succeeds():
+    with StubReviewServer(replies=[(503, {}), (429, {'Retry-After': '0'})]) as stub:
+        records = make_engine(HTTPReviewBackend(stub.url), retries=2).review_sync([make_item(1, 'a=1')])
+    assert len(stub.requests) == 3
+    assert records[0]['suggestion'] == 'fix E225 at 1'
+
+@pytest.mark.parametrize('retries', [0, 1])
+def test_exhausted_retries_fail_the_batch_not_the_review(retries):
+    with StubReviewServer(replies=[(500, {})] * (retries + 1)) as stub:
+        records = make_engine(HTTPReviewBackend(stub.url), retries=retries).review_sync([make_item(1, 'a=1'), make_item(2, 'b=2')],
+                                                                                         batches=[[0, 1]])
+    assert len(stub.requests) == retries + 1
+    assert all(record['suggestion'].startswith('[AI] Review failed') for record in records)
+    # A failed review leaves the code as it was
+    assert [record['recommended_code'] for record in records] == ['a=1', 'b=2']
@@ -0,0 +1,43 @@
+import os
+import math
+from utils.shared_state import get_state_backend
+from utils.repo_mirror import last_review
+from utils.manifest import load_manifest, supported_files
+
+# Queued plus running reviews; attached and results-store hits never reach the queue
+MAX_ACTIVE_PER_CLIENT = int(os.getenv('MAX_ACTIVE_PER_CLIENT', 3))
+MAX_ACTIVE_JOBS = int(os.getenv('MAX_ACTIVE_JOBS', 50))
+MAX_QUEUE_DEPTH = int(os.getenv('MAX_QUEUE_DEPTH', 100))
+ADMISSION_RETRY_SECONDS = int(os.getenv('ADMISSION_RETRY_SECONDS', 10))
+# Header carrying the real client behind a trusted proxy (e.g. X-Forwarded-For); empty uses the peer address
+CLIENT_ID_HEADER = os.getenv('CLIENT_ID_HEADER', '')
+# Priority guess for a repo this server has never reviewed
+GITHUB_ESTIMATED_FILES = int(os.getenv('GITHUB_ESTIMATED_FILES', 500))
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def client_id(request):
+    if CLIENT_ID_HEADER and request.headers.get(CLIENT_ID_HEADER):
+        return request.headers[CLIENT_ID_HEADER].split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+def check_admission(client):
+    backend = get_state_backend()
+    depth = backend.depth()
+    if depth >= MAX_QUEUE_DEPTH:
+        # Back off in proportion to how far past the limit the queue is
+        raise AdmissionRejected('Review queue is full, try again later.',
+                                ADMISSION_RETRY_SECONDS * math.ceil((depth + 1) / max(MAX_QUEUE_DEPTH, 1)))
+    if backend.active_jobs() >= MAX_ACTIVE_JOBS:
+        raise AdmissionRejected('Too many reviews in progress, try again later.', ADMISSION_RETRY_SECONDS)
+    if backend.active_jobs(client) >= MAX_ACTIVE_PER_CLIENT:
+        raise AdmissionRejected(f'At most {MAX_ACTIVE_PER_CLIENT} reviews per client may run at once.', ADMISSION_RETRY_SECONDS)
+
+def estimate_github_files(repo_url):
+    # Size of the last review of this repo, when its session is still around
+    previous = last_review(repo_url)
+    manifest = load_manifest(previous['session_dir']) if previous and os.path.isdir(previous['session_dir']) else None
+    return len(supported_files(manifest)) if manifest else GITHUB_ESTIMATED_FILES
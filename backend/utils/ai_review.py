@@ -1,11 +1,17 @@
 import os
 import json
+from utils.language_detect import is_skipped_path
+from utils.review_engine import ReviewEngine, HTTPReviewBackend, AI_REVIEW_URL, AI_REVIEW_BATCH_SIZE, PROMPT_VERSION
+from utils.review_cache import get_review_cache
+from utils.file_reader import SessionFiles
+from utils.context_packer import pack_items, add_token_stats
+
+AI_REVIEW_BACKEND = os.getenv('AI_REVIEW_BACKEND', 'mock')
 
 def mock_gemini_review(file, line, issue, code, linter_output, best_practices):
     # This is a mock. Replace with real Gemini Pro API call.
     suggestion = f"[AI] Suggestion for: {issue.get('message', issue)}"
     recommended_code = code  # For demo, just echo code
-    patch = f"--- {file}\n+++ {file}\n@@ -{line} +{line} @@\n-{code}\n+{recommended_code}\n"
     return {
         "file": file,
         "line": line,
@@ -13,54 +19,90 @@ def mock_gemini_review(file, line, issue, code, linter_output, best_practices):
         "suggestion": suggestion,
         "current_code": code,
         "recommended_code": recommended_code,
-        "patch": patch
+        "patch": ""
     }
 
-def run_ai_review_on_rag(directory, lang_map, rag_context):
+class MockReviewBackend:
+    async def review_batch(self, items):
+        responses = []
+        for item in items:
+            result = mock_gemini_review(item['file'], item['line'], item['issue'], item['code'],
+                                        item['linter_output'], item['best_practices'])
+            responses.append({'suggestion': result['suggestion'], 'recommended_code': result['recommended_code']})
+        return responses
+
+def get_review_backend(name=None):
+    name = name or AI_REVIEW_BACKEND
+    if name == 'http':
+        if not AI_REVIEW_URL:
+            raise ValueError('AI_REVIEW_URL must be set when AI_REVIEW_BACKEND=http')
+        return HTTPReviewBackend(AI_REVIEW_URL)
+    return MockReviewBackend()
+
+def run_ai_review_on_rag(directory, lang_map, rag_context, manifest=None, backend=None, stats=None, files=None, token_stats=None):
+    # Slots keep the original per-issue order; reviewable ones are filled in by the engine
     ai_results = []
-    SKIP_DIRS = {'node_modules', '.git', 'dist', 'build', 'venv', '__pycache__', '.venv', '.mypy_cache', '.pytest_cache'}
+    items = []
+    session_files = files or SessionFiles(directory)
     for rel_path, issues in rag_context.items():
-        parts = rel_path.split(os.sep)
-        if any(part in SKIP_DIRS for part in parts):
+        if manifest is not None:
+            entry = manifest.get(rel_path)
+            if entry is None or entry['skipped']:
+                continue
+        elif is_skipped_path(rel_path):
             continue
-        abs_path = os.path.join(directory, rel_path)
-        try:
-            with open(abs_path, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-        except Exception:
-            # File not found or cannot be opened; skip or add a clear message
+        with session_files.open(rel_path) as source:
+            if source is None:
+                # File not found or cannot be opened; skip or add a clear message
+                for entry in issues:
+                    issue = entry.get('issue', {})
+                    ai_results.append({
+                        "file": rel_path,
+                        "line": 1,
+                        "issue": issue,
+                        "suggestion": "[AI] File not found or cannot be opened. Skipping review for this file.",
+                        "current_code": "",
+                        "recommended_code": "",
+                        "patch": ""
+                    })
+                continue
             for entry in issues:
                 issue = entry.get('issue', {})
                 context = entry.get('context', [])
-                ai_results.append({
+                line = issue.get('line', 1) if isinstance(issue, dict) else 1
+                code = source.line(line).strip()
+                items.append({
                     "file": rel_path,
-                    "line": 1,
+                    "line": line,
+                    "language": lang_map.get(rel_path, 'Unknown'),
                     "issue": issue,
-                    "suggestion": "[AI] File not found or cannot be opened. Skipping review for this file.",
-                    "current_code": "",
-                    "recommended_code": "",
-                    "patch": ""
+                    "code": code,
+                    "linter_output": issue.get('message', str(issue)) if isinstance(issue, dict) else str(issue),
+                    "best_practices": context
                 })
-            continue
-        for entry in issues:
-            issue = entry.get('issue', {})
-            context = entry.get('context', [])
-            line = issue.get('line', 1) if isinstance(issue, dict) else 1
-            code = lines[line-1].strip() if 0 < line <= len(lines) else ''
-            linter_output = issue.get('message', str(issue))
-            best_practices = context
-            ai_result = mock_gemini_review(
-                file=rel_path,
-                line=line,
-                issue=issue,
-                code=code,
-                linter_output=linter_output,
-                best_practices=best_practices
-            )
-            ai_results.append(ai_result)
-    return ai_results
+                ai_results.append(len(items) - 1)
+    # Each issue is sent with its enclosing scope; scopes shared by several issues go once per request
+    prompts, packed = pack_items(items, session_files, AI_REVIEW_BATCH_SIZE)
+    if files is None:
+        session_files.close()
+    if token_stats is not None:
+        add_token_stats(token_stats, packed)
+    engine = ReviewEngine(backend or get_review_backend(), cache=get_review_cache(), stats=stats, token_stats=token_stats)
+    reviewed = engine.review_sync(items, batches=prompts)
+    return [reviewed[slot] if isinstance(slot, int) else slot for slot in ai_results]
 
-def save_ai_log(directory, ai_results):
+def save_ai_log(directory, ai_results, metadata=None):
     out_path = os.path.join(directory, 'ai_log.json')
     with open(out_path, 'w', encoding='utf-8') as f:
-        json.dump(ai_results, f, indent=2)
+        json.dump({'metadata': {'prompt_version': PROMPT_VERSION, **(metadata or {})}, 'results': ai_results}, f, indent=2)
+
+def load_ai_log(directory):
+    # Returns (results, metadata); older sessions stored a bare list
+    path = os.path.join(directory, 'ai_log.json')
+    if not os.path.exists(path):
+        return [], {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data, {}
+    return data.get('results', []), data.get('metadata', {})
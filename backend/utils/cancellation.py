@@ -0,0 +1,128 @@
+import os
+import signal
+import threading
+import subprocess
+import contextvars
+from utils import metrics
+
+class JobCancelled(Exception):
+    pass
+
+def _kill(proc):
+    # Linters are often wrappers (npx, shell scripts); kill the whole group so no child keeps the pipes open
+    try:
+        if os.name == 'posix':
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+class CancelToken:
+    # Set once per job; cancelling kills every linter process started under it
+    def __init__(self):
+        self._event = threading.Event()
+        self._procs = set()
+        self._children = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            procs = list(self._procs)
+            children = list(self._children)
+        for proc in procs:
+            _kill(proc)
+        for child in children:
+            child.cancel()
+
+    def child(self):
+        # Cancelled with this token, or on its own to stop one part of the job
+        token = CancelToken()
+        with self._lock:
+            self._children.append(token)
+            cancelled = self.cancelled
+        if cancelled:
+            token.cancel()
+        return token
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled('Review cancelled')
+
+    def _track(self, proc):
+        with self._lock:
+            self._procs.add(proc)
+            cancelled = self.cancelled
+        if cancelled:
+            _kill(proc)
+
+    def _untrack(self, proc):
+        with self._lock:
+            self._procs.discard(proc)
+
+# The running job's token follows the work into lint threads and the review event loop through the context
+_current = contextvars.ContextVar('cancel_token', default=None)
+
+def current_token():
+    return _current.get()
+
+def activate(token):
+    return _current.set(token)
+
+def deactivate(reset):
+    _current.reset(reset)
+
+def check_cancelled():
+    token = _current.get()
+    if token is not None:
+        token.check()
+
+def run_process(cmd, timeout):
+    # subprocess.run(cmd, capture_output=True, text=True, timeout=timeout), killable through the job's token
+    token = _current.get()
+    tool = os.path.basename(cmd[0])
+    metrics.count('subprocesses', tool=tool)
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                          start_new_session=os.name == 'posix') as proc:
+        if token is not None:
+            token._track(proc)
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            metrics.count('subprocess_timeouts', tool=tool)
+            _kill(proc)
+            proc.communicate()
+            raise
+        finally:
+            if token is not None:
+                token._untrack(proc)
+    check_cancelled()
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+# Tokens of the jobs running in this process, by session id
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def register_job(session_id):
+    token = CancelToken()
+    with _jobs_lock:
+        _jobs[session_id] = token
+    return token
+
+def unregister_job(session_id):
+    with _jobs_lock:
+        _jobs.pop(session_id, None)
+
+def cancel_job(session_id):
+    # True when the job was running in this process
+    with _jobs_lock:
+        token = _jobs.get(session_id)
+    if token is None:
+        return False
+    token.cancel()
+    return True
@@ -0,0 +1,288 @@
+import os
+import re
+import ast
+from utils.file_reader import FILE_LINE_MAX_CHARS
+
+# Estimated tokens per review request; scopes and issues are packed until the next one would not fit
+AI_REVIEW_TOKEN_BUDGET = int(os.getenv('AI_REVIEW_TOKEN_BUDGET', 4000))
+# Longer enclosing scopes fall back to a window around the issue
+AI_REVIEW_SCOPE_MAX_LINES = int(os.getenv('AI_REVIEW_SCOPE_MAX_LINES', 80))
+# Lines either side of an issue with no enclosing scope (module level, oversized scopes)
+AI_REVIEW_CONTEXT_LINES = int(os.getenv('AI_REVIEW_CONTEXT_LINES', 5))
+# Bigger files skip parsing; their issues get windows
+AI_REVIEW_PARSE_MAX_BYTES = int(os.getenv('AI_REVIEW_PARSE_MAX_BYTES', 1024 * 1024))
+
+# Instructions and JSON framing per request, and per item, on top of the text itself
+PROMPT_OVERHEAD_TOKENS = 32
+ITEM_OVERHEAD_TOKENS = 8
+BYTES_PER_TOKEN = 4
+
+BRACE_LANGUAGES = {'JavaScript', 'TypeScript', 'TSX', 'Java', 'C', 'C++'}
+
+_TOKEN_RE = re.compile(r'[A-Za-z_]+|\d+|[^\sA-Za-z_\d]')
+
+def estimate_tokens(text):
+    # Close to BPE counts for source code without a tokenizer: identifiers split into
+    # ~4-character pieces, numbers and each punctuation character about one token, plus newlines
+    tokens = text.count('\n')
+    for piece in _TOKEN_RE.findall(text):
+        tokens += (len(piece) + BYTES_PER_TOKEN - 1) // BYTES_PER_TOKEN if len(piece) > BYTES_PER_TOKEN else 1
+    return tokens
+
+def python_scopes(text):
+    # (start, end) of every def and class, decorators included; None when the file doesn't parse
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    scopes = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            scopes.append((start, node.end_lineno))
+    return scopes
+
+def brace_scopes(text):
+    # (open line, close line) of every multi-line {...} block, skipping strings and comments
+    scopes = []
+    stack = []
+    line = 1
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == '\n':
+            line += 1
+        elif ch == '/' and text.startswith('//', i):
+            end = text.find('\n', i)
+            i = n if end == -1 else end
+            continue
+        elif ch == '/' and text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            line += text.count('\n', i, end)
+            i = end
+            continue
+        elif ch in '"\'`':
+            j = i + 1
+            while j < n and text[j] != ch:
+                # Only template literals span lines; an unterminated quote ends at the line
+                if text[j] == '\\':
+                    j += 1
+                elif text[j] == '\n' and ch != '`':
+                    break
+                j += 1
+            line += text.count('\n', i, min(j, n))
+            i = j + 1 if j < n and text[j] == ch else j
+            continue
+        elif ch == '{':
+            stack.append(line)
+        elif ch == '}' and stack:
+            start = stack.pop()
+            if line > start:
+                scopes.append((start, line))
+        i += 1
+    return scopes
+
+def _brace_header(lines, start):
+    # Pull in the signature when the brace sits on its own line or the parameters wrap
+    while start > 1:
+        previous = lines[start - 2].rstrip()
+        current = lines[start - 1].strip()
+        if current.startswith('{') or previous.endswith((',', '(')) or current.startswith(')'):
+            start -= 1
+        else:
+            break
+    return start
+
+def indent_scope(lines, lineno):
+    # The block the line sits in: up to the nearest less-indented line, down to where the
+    # indentation drops back to it. None at top level.
+    def indent(text):
+        return len(text) - len(text.lstrip())
+    if not 0 < lineno <= len(lines) or not lines[lineno - 1].strip():
+        return None
+    level = indent(lines[lineno - 1])
+    start = lineno
+    while start > 1:
+        start -= 1
+        if lines[start - 1].strip() and indent(lines[start - 1]) < level:
+            break
+    else:
+        return None
+    header = indent(lines[start - 1])
+    end = lineno
+    last = lineno
+    while end < len(lines):
+        end += 1
+        if lines[end - 1].strip():
+            if indent(lines[end - 1]) <= header:
+                break
+            last = end
+    return start, last
+
+def _window(lineno, line_count):
+    return max(lineno - AI_REVIEW_CONTEXT_LINES, 1), min(lineno + AI_REVIEW_CONTEXT_LINES, max(line_count, 1))
+
+class FileScopes:
+    # Enclosing-scope lookup for one file; the file is parsed once for all of its issues
+    def __init__(self, source, language):
+        self.source = source
+        self.line_count = len(source)
+        self.lines = None
+        self.scopes = None
+        if source.size > AI_REVIEW_PARSE_MAX_BYTES:
+            return
+        # Uncapped, so long lines (minified code, big literals) don't corrupt the parse;
+        # split on '\n' only, to keep the reader's line numbers
+        self.lines = [line.rstrip('\r') for line in source.text().split('\n')][:self.line_count]
+        if language == 'Python':
+            self.scopes = python_scopes('\n'.join(self.lines))
+        elif language in BRACE_LANGUAGES:
+            self.scopes = [(_brace_header(self.lines, start), end) for start, end in brace_scopes('\n'.join(self.lines))]
+
+    def scope(self, lineno):
+        # (start, end) of the smallest scope holding the line, or a window around it
+        if not isinstance(lineno, int) or not 0 < lineno <= self.line_count:
+            lineno = 1
+        found = None
+        if self.scopes is not None:
+            holding = [scope for scope in self.scopes if scope[0] <= lineno <= scope[1]]
+            found = min(holding, key=lambda scope: scope[1] - scope[0]) if holding else None
+        elif self.lines is not None:
+            found = indent_scope(self.lines, lineno)
+        if found is None or found[1] - found[0] + 1 > AI_REVIEW_SCOPE_MAX_LINES:
+            return _window(lineno, self.line_count)
+        return found
+
+    def whole_file_tokens(self):
+        if self.lines is None:
+            return self.source.size // BYTES_PER_TOKEN
+        return estimate_tokens('\n'.join(self.lines))
+
+def item_tokens(item):
+    text = '\n'.join([item['linter_output'], item['code'], *map(str, item.get('best_practices', []))])
+    return estimate_tokens(text) + ITEM_OVERHEAD_TOKENS
+
+def prompt_tokens(items):
+    # What one request carrying these items costs: shared scopes are counted once
+    scopes = {item['scope']['id']: item['scope']['tokens'] for item in items if item.get('scope')}
+    return PROMPT_OVERHEAD_TOKENS + sum(scopes.values()) + sum(item_tokens(item) for item in items)
+
+def prompt_payload(items):
+    # Request body without the prompt version: each scope once, items pointing at theirs
+    contexts = {}
+    payload_items = []
+    for item in items:
+        entry = {key: value for key, value in item.items() if key != 'scope'}
+        scope = item.get('scope')
+        if scope:
+            contexts.setdefault(scope['id'], {key: scope[key] for key in ('id', 'file', 'start_line', 'end_line', 'code')})
+            entry['context_id'] = scope['id']
+        payload_items.append(entry)
+    return {'contexts': list(contexts.values()), 'items': payload_items}
+
+def _line(item):
+    return item['line'] if isinstance(item['line'], int) else 0
+
+def _merge(spans):
+    # Overlapping and nested spans collapse into one: [(start, end, [item indexes])]
+    merged = []
+    for start, end, indexes in sorted(spans, key=lambda span: (span[0], -span[1])):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end), merged[-1][2] + indexes)
+        else:
+            merged.append((start, end, list(indexes)))
+    return merged
+
+def _make_scope(rel_path, scopes, start, end):
+    # The prompt gets lines capped like everywhere else
+    code = '\n'.join(line[:FILE_LINE_MAX_CHARS] for line in scopes.lines[start - 1:end]) if scopes.lines is not None else \
+        '\n'.join(scopes.source.line(n) for n in range(start, end + 1))
+    return {'id': f'{rel_path}:{start}-{end}', 'file': rel_path, 'start_line': start, 'end_line': end,
+            'code': code, 'tokens': estimate_tokens(code) + ITEM_OVERHEAD_TOKENS}
+
+def _fits(items, indexes, budget):
+    return prompt_tokens([items[i] for i in indexes]) <= budget
+
+def pack_file(rel_path, indexes, items, scopes, budget, max_items, stats):
+    # Attaches a scope to each item and returns the file's prompts as lists of item indexes
+    spans = []
+    for i in indexes:
+        start, end = scopes.scope(items[i]['line'])
+        spans.append((start, end, [i]))
+    stats['scopes'] += len(spans)
+    blocks = _merge(spans)
+    # A block too big for one request is re-cut into windows around its own issues
+    units = []
+    for start, end, block_indexes in blocks:
+        block_indexes.sort(key=lambda i: _line(items[i]))
+        scope = _make_scope(rel_path, scopes, start, end)
+        for i in block_indexes:
+            items[i]['scope'] = scope
+        if _fits(items, block_indexes, budget):
+            units.append(block_indexes)
+            continue
+        windows = _merge([(*_window(_line(items[i]), scopes.line_count), [i]) for i in block_indexes])
+        for window_start, window_end, window_indexes in windows:
+            window_scope = _make_scope(rel_path, scopes, max(window_start, start), min(window_end, end))
+            for i in window_indexes:
+                items[i]['scope'] = window_scope
+            units.append(window_indexes)
+    stats['unique_scopes'] += len({items[i]['scope']['id'] for unit in units for i in unit})
+    prompts = []
+    current = []
+    for unit in units:
+        # A unit that a fresh request can't hold goes issue by issue
+        parts = [unit] if len(unit) <= max_items and _fits(items, unit, budget) else [[i] for i in unit]
+        for part in parts:
+            if current and (len(current) + len(part) > max_items or not _fits(items, current + part, budget)):
+                prompts.append(current)
+                current = []
+            current = current + part
+    if current:
+        prompts.append(current)
+    for prompt in prompts:
+        tokens = prompt_tokens([items[i] for i in prompt])
+        stats['prompt_tokens'] += tokens
+        stats['over_budget'] += tokens > budget
+    stats['prompts'] += len(prompts)
+    return prompts
+
+def pack_items(items, session_files, max_items, budget=None):
+    # Per file: enclosing scope per issue, overlapping scopes merged, issues packed into at most
+    # max_items per request under the token budget. Returns (prompts as lists of item indexes, token stats).
+    budget = budget or AI_REVIEW_TOKEN_BUDGET
+    stats = new_token_stats()
+    by_file = {}
+    for index, item in enumerate(items):
+        by_file.setdefault(item['file'], []).append(index)
+    prompts = []
+    for rel_path, indexes in by_file.items():
+        with session_files.open(rel_path) as source:
+            if source is None:
+                prompts.extend([i] for i in indexes)
+                continue
+            indexes.sort(key=lambda i: _line(items[i]))
+            scopes = FileScopes(source, items[indexes[0]]['language'])
+            prompts.extend(pack_file(rel_path, indexes, items, scopes, budget, max_items, stats))
+            # Baseline: the whole file sent with every issue, one request each
+            whole_file = scopes.whole_file_tokens()
+        stats['whole_file_tokens'] += sum(PROMPT_OVERHEAD_TOKENS + whole_file + item_tokens(items[i]) for i in indexes)
+    stats['issues'] += len(items)
+    return prompts, stats
+
+def new_token_stats():
+    return {'issues': 0, 'prompts': 0, 'scopes': 0, 'unique_scopes': 0, 'prompt_tokens': 0, 'sent_tokens': 0,
+            'whole_file_tokens': 0, 'tokens_saved': 0, 'over_budget': 0}
+
+def add_token_stats(total, stats):
+    for key, value in stats.items():
+        if key != 'tokens_saved':
+            total[key] = total.get(key, 0) + value
+    return total
+
+def finish_token_stats(stats):
+    # prompt_tokens is what the packed prompts cost; sent_tokens leaves out review-cache hits
+    stats['tokens_saved'] = max(stats['whole_file_tokens'] - stats['prompt_tokens'], 0)
+    return stats
@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+class DiskCache:
+    # One JSON file per key, sharded by key prefix; mtime doubles as the LRU clock
+    def __init__(self, directory, max_bytes, ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.total_bytes = None
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            # Bump mtime so eviction treats the entry as recently used
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, value):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value).encode('utf-8')
+        # Overwriting a key replaces its bytes rather than adding to them
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, size, _ in self._list_entries())
+            else:
+                self.total_bytes += len(data) - old_size
+            if self.total_bytes > self.max_bytes:
+                self.total_bytes = self.evict(int(self.max_bytes * 0.9))
+
+    def _list_entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for fname in files:
+                path = os.path.join(root, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self, target_bytes):
+        # Expired entries go first, then least recently used until under target
+        now = time.time()
+        entries = sorted(self._list_entries())
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            expired = self.ttl is not None and now - mtime > self.ttl
+            if total <= target_bytes and not expired:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
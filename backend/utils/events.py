@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import threading
+
+EVENTS_FILE = 'events.ndjson'
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _file_lock(path):
+    with _locks_lock:
+        return _locks.setdefault(path, threading.Lock())
+
+def forget_session(session_dir):
+    # Called when the session directory is removed
+    with _locks_lock:
+        _locks.pop(os.path.join(session_dir, EVENTS_FILE), None)
+
+def valid_offset(session_dir, offset):
+    # Event ids are offsets of line starts; anything else would resume mid-line
+    if offset == 0:
+        return True
+    path = os.path.join(session_dir, EVENTS_FILE)
+    try:
+        with open(path, 'rb') as f:
+            if offset > os.fstat(f.fileno()).st_size:
+                return False
+            f.seek(offset - 1)
+            return f.read(1) == b'\n'
+    except OSError:
+        return False
+
+def append_event(session_dir, event_type, data):
+    # One JSON object per line; the line's byte offset doubles as the event id for resuming
+    path = os.path.join(session_dir, EVENTS_FILE)
+    line = json.dumps({'type': event_type, 'time': time.time(), 'data': data}) + '\n'
+    try:
+        with _file_lock(path):
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except FileNotFoundError:
+        # Removed under a job that was still running; don't leave its lock behind
+        forget_session(session_dir)
+        raise
+
+def read_events(session_dir, offset=0):
+    # Returns ([(next_offset, event)], offset); a partially written last line is left for the next read
+    path = os.path.join(session_dir, EVENTS_FILE)
+    events = []
+    if not os.path.exists(path):
+        return events, offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            offset += len(raw)
+            events.append((offset, json.loads(raw)))
+    return events, offset
+
+def follow_events(session_dir, offset=0, poll_interval=0.2, timeout=3600, finished=None):
+    # Yields (offset, event) until the session reaches a terminal status, its directory is
+    # removed, or finished() says it is done (a resume past the terminal event)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        events, offset = read_events(session_dir, offset)
+        for event_offset, event in events:
+            yield event_offset, event
+            if event['type'] == 'status' and event['data'].get('status') in ('complete', 'error', 'cancelled'):
+                return
+        if events:
+            continue
+        if not os.path.isdir(session_dir) or (finished is not None and finished()):
+            # Whatever was appended before the check still goes out
+            for event_offset, event in read_events(session_dir, offset)[0]:
+                yield event_offset, event
+            return
+        time.sleep(poll_interval)
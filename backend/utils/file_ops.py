@@ -1,7 +1,23 @@
 import os
+import uuid
 import zipfile
-from git import Repo
+from concurrent.futures import ThreadPoolExecutor
+from utils.repo_mirror import fetch_head, checkout_tree
 import logging
+from utils.language_detect import is_skipped_path, is_no_sniff, detect_language_by_extension, detect_language_by_header, SNIFF_BYTES
+from utils.linter import SUPPORTED_LANGUAGES
+from utils.manifest import SESSION_ARTIFACTS
+from utils import metrics
+
+MAX_UNCOMPRESSED_MB = int(os.getenv('MAX_UNCOMPRESSED_MB', 2048))
+MAX_UNCOMPRESSED_SIZE = MAX_UNCOMPRESSED_MB * 1024 * 1024
+MAX_COMPRESSION_RATIO = int(os.getenv('MAX_COMPRESSION_RATIO', 100))
+# Tiny members legitimately compress far better than the ratio limit
+RATIO_CHECK_MIN_BYTES = 1024 * 1024
+ZIP_EXTRACT_WORKERS = int(os.getenv('ZIP_EXTRACT_WORKERS', 4))
+
+class ZipRejected(Exception):
+    pass
 
 def save_uploaded_file(file, dest_dir):
     os.makedirs(dest_dir, exist_ok=True)
@@ -10,33 +26,180 @@ def save_uploaded_file(file, dest_dir):
     return file_path
 
 def clone_github_repo(repo_url, dest_dir):
-    os.makedirs(dest_dir, exist_ok=True)
-    Repo.clone_from(repo_url, dest_dir)
+    # Shallow fetch into the shared mirror, then export only the working tree; returns the commit reviewed
+    commit = fetch_head(repo_url)
+    checkout_tree(repo_url, commit, dest_dir)
+    return commit
+
+def _safe_member_path(name):
+    # Reject absolute paths and anything escaping the extraction root
+    rel_path = os.path.normpath(name.replace('\\', '/')).lstrip('/')
+    if os.path.isabs(rel_path) or rel_path == '..' or rel_path.startswith('..' + os.sep):
+        return None
+    return rel_path
 
-def extract_zip(zip_path, extract_to):
+def _member_language(zip_ref, info, rel_path):
+    lang = detect_language_by_extension(rel_path)
+    if lang or is_no_sniff(os.path.basename(rel_path)):
+        return lang
+    # Unknown extension: peek at the member's first bytes for a shebang or modeline
+    try:
+        with zip_ref.open(info) as member:
+            return detect_language_by_header(member.read(SNIFF_BYTES))
+    except Exception:
+        return None
+
+def plan_zip_extraction(zip_source):
+    # Decide from the central directory alone what is worth writing; nothing touches the disk
+    selected = []
+    skipped = []
+    total_size = 0
+    try:
+        zip_ref = zipfile.ZipFile(zip_source, 'r')
+    except zipfile.BadZipFile as e:
+        raise ZipRejected(f'Invalid ZIP archive: {str(e)}')
+    with zip_ref:
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                continue
+            rel_path = _safe_member_path(info.filename)
+            if rel_path is None:
+                skipped.append((info.filename, 'unsafe path'))
+                continue
+            if is_skipped_path(rel_path):
+                skipped.append((info.filename, 'ignored directory'))
+                continue
+            if _member_language(zip_ref, info, rel_path) not in SUPPORTED_LANGUAGES:
+                skipped.append((info.filename, 'unsupported language'))
+                continue
+            if info.file_size >= RATIO_CHECK_MIN_BYTES and info.file_size > info.compress_size * MAX_COMPRESSION_RATIO:
+                raise ZipRejected(f'ZIP member {info.filename} exceeds the maximum compression ratio ({MAX_COMPRESSION_RATIO}:1).')
+            total_size += info.file_size
+            if total_size > MAX_UNCOMPRESSED_SIZE:
+                raise ZipRejected(f'ZIP contents too large when uncompressed (max {MAX_UNCOMPRESSED_MB}MB).')
+            selected.append((info, rel_path))
+    if not selected:
+        raise ZipRejected('No supported code files found in the ZIP. The archive may only contain dependencies or unsupported files.')
+    return selected, skipped
+
+def _extract_members(zip_path, members, extract_to):
+    extracted = []
+    skipped = []
+    total_written = 0
+    # ZipFile handles are not shared between threads
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        skipped = []
-        extracted = []
-        for member in zip_ref.infolist():
+        for info, rel_path in members:
+            target = os.path.join(extract_to, rel_path)
             try:
-                zip_ref.extract(member, extract_to)
-                extracted.append(member.filename)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                written = 0
+                with zip_ref.open(info) as src, open(target, 'wb') as dst:
+                    for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                        written += len(chunk)
+                        # The central directory can lie about sizes; never write more than it declared
+                        if written > info.file_size:
+                            raise ZipRejected('member larger than its declared size')
+                        dst.write(chunk)
+                extracted.append(info.filename)
+                total_written += written
             except Exception as e:
-                skipped.append((member.filename, str(e)))
-        if skipped:
-            logging.warning(f"Skipped {len(skipped)} files during extraction due to errors: {skipped}")
+                if os.path.exists(target):
+                    os.remove(target)
+                skipped.append((info.filename, str(e)))
+    return extracted, skipped, total_written
+
+def extract_zip(zip_path, extract_to, workers=None):
+    members, skipped = plan_zip_extraction(zip_path)
+    workers = max(1, min(workers or ZIP_EXTRACT_WORKERS, len(members)))
+    chunks = [members[i::workers] for i in range(workers)]
+    extracted = []
+    written = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for chunk_extracted, chunk_skipped, chunk_written in pool.map(lambda chunk: _extract_members(zip_path, chunk, extract_to), chunks):
+            extracted.extend(chunk_extracted)
+            skipped.extend(chunk_skipped)
+            written += chunk_written
+    metrics.count('extracted_bytes', written, source='zip')
+    if skipped:
+        logging.warning(f"Skipped {len(skipped)} files during extraction: {skipped[:50]}")
     return extracted, skipped
 
-def create_session_zip(session_dir, zip_path=None):
-    if zip_path is None:
-        zip_path = os.path.join(session_dir, 'session_package.zip')
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        # Add all files except the ZIP itself
+# Built on first download; the cached archive name per package variant
+SESSION_PACKAGES = {'all': 'session_package.zip', 'artifacts': 'session_artifacts.zip'}
+SESSION_ZIP_CHUNK = 64 * 1024
+
+class _ChunkSink:
+    # Write-only and unseekable, so zipfile emits data descriptors instead of rewinding headers
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def session_package_entries(session_dir, manifest=None, include_sources=True):
+    entries = []
+    if include_sources and manifest is not None:
+        # Reviewed sources come from the manifest; only the session root needs listing for artifacts
+        entries.extend(rel_path for rel_path, entry in manifest.items() if not entry['skipped'])
+    elif include_sources:
         for root, _, files in os.walk(session_dir):
             for file in files:
-                if file.endswith('.zip'):
-                    continue
-                abs_path = os.path.join(root, file)
-                rel_path = os.path.relpath(abs_path, session_dir)
-                zipf.write(abs_path, rel_path)
-    return zip_path 
\ No newline at end of file
+                rel_path = os.path.relpath(os.path.join(root, file), session_dir)
+                if os.sep in rel_path and not file.endswith('.zip'):
+                    entries.append(rel_path)
+    for name in sorted(os.listdir(session_dir)):
+        # Cached packages and in-progress ones from concurrent downloads
+        if name.endswith(('.zip', '.tmp')) or not os.path.isfile(os.path.join(session_dir, name)):
+            continue
+        if name in SESSION_ARTIFACTS or (include_sources and (manifest is None or name not in manifest)):
+            entries.append(name)
+    return sorted(set(entries))
+
+def stream_session_zip(session_dir, manifest=None, include_sources=True, cache_path=None):
+    # Yields the archive as it is compressed; with cache_path the same bytes are kept for later downloads
+    sink = _ChunkSink()
+    tmp_path = f'{cache_path}.{uuid.uuid4().hex}.tmp' if cache_path else None
+    cache = open(tmp_path, 'wb') if tmp_path else None
+
+    def drain():
+        data = sink.drain()
+        if data and cache:
+            cache.write(data)
+        return data
+
+    try:
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for rel_path in session_package_entries(session_dir, manifest, include_sources):
+                abs_path = os.path.join(session_dir, rel_path)
+                zinfo = zipfile.ZipInfo.from_file(abs_path, rel_path)
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with open(abs_path, 'rb') as src, zipf.open(zinfo, 'w') as dst:
+                    while True:
+                        chunk = src.read(SESSION_ZIP_CHUNK)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        data = drain()
+                        if data:
+                            yield data
+        data = drain()
+        if data:
+            yield data
+        if cache:
+            cache.close()
+            cache = None
+            os.replace(tmp_path, cache_path)
+    finally:
+        # Client went away mid-stream: drop the partial archive
+        if cache:
+            cache.close()
+            os.remove(tmp_path)
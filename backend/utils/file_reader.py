@@ -0,0 +1,151 @@
+import os
+import mmap
+import threading
+from contextlib import contextmanager
+from array import array
+from collections import OrderedDict
+
+# Smaller files are read into memory; larger ones are mapped so only touched pages stay resident
+FILE_MMAP_MIN_BYTES = int(os.getenv('FILE_MMAP_MIN_BYTES', 64 * 1024))
+# Minified/generated files can have multi-MB lines; stages only ever need the start of one
+FILE_LINE_MAX_CHARS = int(os.getenv('FILE_LINE_MAX_CHARS', 4096))
+SESSION_OPEN_FILES = int(os.getenv('SESSION_OPEN_FILES', 64))
+
+# Read-only view of a source file split on b'\n', with the line-start offsets indexed once.
+# line() takes 1-based line numbers as linters report them; indexing is 0-based and
+# yields decoded lines with their endings, like readlines().
+class LineIndexedFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= FILE_MMAP_MIN_BYTES:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = f.read()
+        self._offsets = array('q', [0])
+        find = self._data.find
+        pos = find(b'\n')
+        while pos != -1:
+            self._offsets.append(pos + 1)
+            pos = find(b'\n', pos + 1)
+        self._size = len(self._data)
+        # A trailing newline does not start another line
+        if self._offsets[-1] == self._size and len(self._offsets) > 1:
+            self._offsets.pop()
+        elif self._size == 0:
+            self._offsets.pop()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    @property
+    def size(self):
+        return self._size
+
+    def _raw(self, index):
+        start = self._offsets[index]
+        end = self._offsets[index + 1] if index + 1 < len(self._offsets) else self._size
+        return self._data[start:end]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._raw(i).decode('utf-8', errors='replace') for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('line index out of range')
+        return self._raw(index).decode('utf-8', errors='replace')
+
+    def line(self, lineno):
+        # Text of a 1-based line without its ending; '' when out of range
+        if not isinstance(lineno, int) or not 0 < lineno <= len(self):
+            return ''
+        start = self._offsets[lineno - 1]
+        end = self._offsets[lineno] if lineno < len(self._offsets) else self._size
+        # Cap in bytes first (a UTF-8 char is at most 4) so huge lines are never decoded whole
+        raw = self._data[start:min(end, start + FILE_LINE_MAX_CHARS * 4)]
+        return raw.decode('utf-8', errors='replace').rstrip('\r\n')[:FILE_LINE_MAX_CHARS]
+
+    def text(self):
+        # The whole file decoded, lines uncapped: for parsers that need the exact source
+        return self._data[:].decode('utf-8', errors='replace')
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+# Per-session cache of open files, so every stage sees the same lines of the same file.
+# Readers are reference-counted: one evicted while a stage still holds it is closed on its last release.
+class SessionFiles:
+    def __init__(self, directory, max_open=SESSION_OPEN_FILES):
+        self.directory = directory
+        self.max_open = max_open
+        self._files = OrderedDict()
+        self._holds = {}
+        self._retired = set()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def open(self, rel_path):
+        # Yields the file's reader, or None when the file is missing or unreadable
+        reader = self._acquire(rel_path)
+        try:
+            yield reader
+        finally:
+            if reader is not None:
+                self._release(reader)
+
+    def _acquire(self, rel_path):
+        with self._lock:
+            reader = self._files.get(rel_path)
+            if reader is not None:
+                self._files.move_to_end(rel_path)
+                self._holds[reader] += 1
+                return reader
+        try:
+            reader = LineIndexedFile(os.path.join(self.directory, rel_path))
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            if rel_path in self._files:
+                # Another stage opened it meanwhile
+                reader.close()
+                reader = self._files[rel_path]
+                self._files.move_to_end(rel_path)
+                self._holds[reader] += 1
+                return reader
+            self._files[rel_path] = reader
+            self._holds[reader] = 1
+            while len(self._files) > self.max_open:
+                _, evicted = self._files.popitem(last=False)
+                self._retire(evicted)
+        return reader
+
+    def _retire(self, reader):
+        # Caller holds the lock
+        if self._holds[reader] == 0:
+            del self._holds[reader]
+            reader.close()
+        else:
+            self._retired.add(reader)
+
+    def _release(self, reader):
+        with self._lock:
+            self._holds[reader] -= 1
+            if self._holds[reader] == 0 and reader in self._retired:
+                self._retired.discard(reader)
+                del self._holds[reader]
+                reader.close()
+
+    def close(self):
+        with self._lock:
+            for reader in self._files.values():
+                self._retire(reader)
+            self._files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,110 @@
+import os
+import time
+import socket
+import threading
+import logging
+import traceback
+from utils.pipeline import run_review_pipeline, PipelineError
+from utils.session import set_session_status, session_manager
+from utils.cancellation import JobCancelled, register_job, unregister_job, activate, deactivate
+from utils.results_store import release_submission
+from utils.shared_state import get_state_backend
+from utils import metrics
+
+REVIEW_WORKERS = int(os.getenv('REVIEW_WORKERS', 2))
+# A job whose worker keeps dying (OOM, segfaulting linter) is given up on rather than retried forever
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_CANCEL_POLL_SECONDS = float(os.getenv('JOB_CANCEL_POLL_SECONDS', 1))
+
+_workers = []
+_workers_lock = threading.Lock()
+
+def _heartbeat_loop(backend, job, worker_id, token, stop):
+    # Renews the lease, and picks up cancellations made through another process
+    interval = getattr(backend, 'lease_seconds', 60) / 3
+    next_beat = time.monotonic() + interval
+    while not stop.wait(JOB_CANCEL_POLL_SECONDS):
+        if backend.is_cancelled(job):
+            token.cancel()
+        if time.monotonic() >= next_beat:
+            next_beat = time.monotonic() + interval
+            if not backend.heartbeat(job, worker_id):
+                logging.warning(f"Lost the lease on review job {job['session_id']}")
+                return
+
+def _run_job(job):
+    # Returns the outcome: 'complete', 'cancelled' or 'error'
+    session_dir = job['session_dir']
+    try:
+        with metrics.profile_session(session_dir):
+            run_review_pipeline(session_dir, job['session_id'], job)
+        return 'complete'
+    except JobCancelled:
+        # DELETE /session already reported it; the worker owns the directory until it stops
+        logging.info(f"Review job {job['session_id']} cancelled")
+        session_manager.remove(session_dir)
+        return 'cancelled'
+    except PipelineError as e:
+        set_session_status(session_dir, 'error', {'error': str(e)})
+    except Exception as e:
+        logging.exception(f"Review job {job['session_id']} failed")
+        set_session_status(session_dir, 'error', {'error': str(e), 'traceback': traceback.format_exc()})
+    return 'error'
+
+def _worker_loop(worker_id):
+    backend = get_state_backend()
+    while True:
+        job = backend.claim(worker_id)
+        if job is None:
+            continue
+        if job['attempt'] > 1:
+            logging.warning(f"Re-running review job {job['session_id']} (attempt {job['attempt']}) after its worker stopped")
+        token = register_job(job['session_id'])
+        if backend.is_cancelled(job):
+            token.cancel()
+        reset = activate(token)
+        session_metrics = metrics.SessionMetrics()
+        metrics_reset = metrics.activate(session_metrics)
+        if job.get('enqueued_at'):
+            waited = max(time.time() - job['enqueued_at'], 0.0)
+            metrics.registry.observe('review_queue_wait_seconds', waited)
+            session_metrics.add_stage('queue_wait', waited)
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat_loop, args=(backend, job, worker_id, token, stop), daemon=True)
+        heartbeat.start()
+        outcome = 'error'
+        try:
+            if job['attempt'] > JOB_MAX_ATTEMPTS:
+                set_session_status(job['session_dir'], 'error',
+                                   {'error': f'Review abandoned after {JOB_MAX_ATTEMPTS} failed attempts.'})
+            else:
+                outcome = _run_job(job)
+        finally:
+            stop.set()
+            metrics.registry.inc('review_sessions_total', outcome=outcome)
+            metrics.registry.observe('review_session_seconds', session_metrics.elapsed(), outcome=outcome)
+            metrics.deactivate(metrics_reset)
+            deactivate(reset)
+            unregister_job(job['session_id'])
+            if job.get('submission_key'):
+                release_submission(job['submission_key'])
+            backend.finish(job, worker_id)
+
+def start_workers(count=None):
+    count = REVIEW_WORKERS if count is None else count
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    with _workers_lock:
+        while len(_workers) < count:
+            t = threading.Thread(target=_worker_loop, args=(f'{prefix}:{len(_workers)}',),
+                                 name=f'review-worker-{len(_workers)}', daemon=True)
+            t.start()
+            _workers.append(t)
+    return list(_workers)
+
+def enqueue_job(job):
+    backend = get_state_backend()
+    # Without a shared backend nobody else will pick the job up
+    if not backend.shared:
+        start_workers()
+    set_session_status(job['session_dir'], 'queued')
+    backend.enqueue({**job, 'enqueued_at': time.time()})
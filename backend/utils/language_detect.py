@@ -1,34 +1,181 @@
 import os
+import re
 import json
+import threading
+from collections import OrderedDict
 from pygments.lexers import guess_lexer_for_filename
 from pygments.util import ClassNotFound
 
 EXTENSION_LANGUAGE_MAP = {
     '.py': 'Python',
+    '.pyw': 'Python',
+    '.pyi': 'Python',
     '.js': 'JavaScript',
+    '.jsx': 'JavaScript',
+    '.mjs': 'JavaScript',
+    '.cjs': 'JavaScript',
+    '.ts': 'TypeScript',
+    '.mts': 'TypeScript',
+    '.cts': 'TypeScript',
+    '.tsx': 'TSX',
     '.java': 'Java',
     '.c': 'C',
+    '.h': 'C',
     '.cpp': 'C++',
+    '.cc': 'C++',
+    '.cxx': 'C++',
+    '.c++': 'C++',
+    '.hpp': 'C++',
+    '.hh': 'C++',
+    '.hxx': 'C++',
     '.md': 'Markdown',
     '.txt': 'Text',
+    '.json': 'JSON',
+    '.yml': 'YAML',
+    '.yaml': 'YAML',
+    '.toml': 'TOML',
+    '.xml': 'XML',
+    '.html': 'HTML',
+    '.htm': 'HTML',
+    '.css': 'CSS',
+    '.scss': 'SCSS',
+    '.sh': 'Bash',
+    '.bash': 'Bash',
+    '.rb': 'Ruby',
+    '.go': 'Go',
+    '.rs': 'Rust',
+    '.kt': 'Kotlin',
+    '.php': 'PHP',
+    '.sql': 'SQL',
 }
 
+# Never worth opening: media, archives, compiled output, lockfiles
+NO_SNIFF_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp', '.svg', '.pdf', '.mp3', '.mp4', '.mov', '.wav',
+    '.woff', '.woff2', '.ttf', '.otf', '.eot', '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.tar', '.jar',
+    '.class', '.o', '.a', '.so', '.dll', '.dylib', '.exe', '.pyc', '.wasm', '.lock', '.map',
+}
+
+SHEBANG_LANGUAGES = {
+    'python': 'Python',
+    'node': 'JavaScript',
+    'nodejs': 'JavaScript',
+    'deno': 'TypeScript',
+    'ts-node': 'TypeScript',
+    'bash': 'Bash',
+    'sh': 'Bash',
+    'zsh': 'Bash',
+    'ruby': 'Ruby',
+    'php': 'PHP',
+}
+
+MODELINE_LANGUAGES = {
+    'python': 'Python',
+    'javascript': 'JavaScript',
+    'js': 'JavaScript',
+    'typescript': 'TypeScript',
+    'java': 'Java',
+    'c': 'C',
+    'cpp': 'C++',
+    'c++': 'C++',
+    'sh': 'Bash',
+    'bash': 'Bash',
+}
+
+# 'full' falls back to Pygments; 'linted' stops after the cheap checks, which is
+# enough to find every language a linter can handle
+LANGUAGE_SNIFF_MODE = os.getenv('LANGUAGE_SNIFF_MODE', 'full')
+SNIFF_BYTES = int(os.getenv('LANGUAGE_SNIFF_BYTES', 4096))
+PYGMENTS_PREFIX_BYTES = int(os.getenv('LANGUAGE_PYGMENTS_PREFIX_BYTES', 16384))
+LANGUAGE_CACHE_SIZE = int(os.getenv('LANGUAGE_CACHE_SIZE', 10000))
+
+MODELINE_RE = re.compile(r'(?:-\*-.*?mode:\s*([\w+-]+).*?-\*-|\bvim?:.*?\b(?:ft|filetype|syntax)=([\w+-]+))', re.IGNORECASE)
+
+SKIP_DIRS = {'node_modules', '.git', 'dist', 'build', 'venv', '__pycache__', '.venv', '.mypy_cache', '.pytest_cache'}
+
+_sniff_cache = OrderedDict()
+_sniff_cache_lock = threading.Lock()
+
+def is_skipped_path(rel_path):
+    return any(part in SKIP_DIRS for part in rel_path.split(os.sep))
+
 def detect_language_by_extension(filename):
     _, ext = os.path.splitext(filename)
     return EXTENSION_LANGUAGE_MAP.get(ext.lower(), None)
 
-def detect_language_by_content(filepath):
+def is_no_sniff(filename):
+    name = filename.lower()
+    return any(name.endswith(ext) for ext in NO_SNIFF_EXTENSIONS)
+
+def detect_language_by_shebang(first_line):
+    if not first_line.startswith('#!'):
+        return None
+    parts = first_line[2:].strip().split()
+    if not parts:
+        return None
+    interpreter = os.path.basename(parts[0])
+    if interpreter == 'env' and len(parts) > 1:
+        interpreter = os.path.basename(parts[-1] if parts[1].startswith('-') else parts[1])
+    # python3.11 -> python
+    interpreter = re.sub(r'[\d.]+$', '', interpreter)
+    return SHEBANG_LANGUAGES.get(interpreter)
+
+def detect_language_by_modeline(text):
+    for line in text.splitlines()[:5]:
+        match = MODELINE_RE.search(line)
+        if match:
+            return MODELINE_LANGUAGES.get((match.group(1) or match.group(2)).lower())
+    return None
+
+def is_binary_prefix(prefix):
+    return b'\0' in prefix[:SNIFF_BYTES]
+
+def detect_language_by_header(prefix):
+    # Cheap tiers only: shebang and modeline from the first few KB
+    if is_binary_prefix(prefix):
+        return None
+    text = prefix[:SNIFF_BYTES].decode('utf-8', errors='ignore')
+    return detect_language_by_shebang(text.split('\n', 1)[0]) or detect_language_by_modeline(text)
+
+def _sniff_prefix(filepath, prefix):
+    if is_binary_prefix(prefix):
+        return None
+    lang = detect_language_by_header(prefix)
+    if lang or LANGUAGE_SNIFF_MODE == 'linted':
+        return lang
+    text = prefix.decode('utf-8', errors='ignore')
     try:
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            code = f.read()
-        lexer = guess_lexer_for_filename(filepath, code)
-        return lexer.name
+        return guess_lexer_for_filename(filepath, text).name
     except (ClassNotFound, Exception):
         return None
 
-def detect_languages_in_dir(directory):
+def detect_language_by_content(filepath, content_hash=None):
+    if is_no_sniff(os.path.basename(filepath)):
+        return None
+    cache_key = (content_hash, os.path.splitext(filepath)[1].lower()) if content_hash else None
+    if cache_key:
+        with _sniff_cache_lock:
+            if cache_key in _sniff_cache:
+                _sniff_cache.move_to_end(cache_key)
+                return _sniff_cache[cache_key]
+    try:
+        # Only the prefix is read; binaries and huge bundles never get decoded in full
+        with open(filepath, 'rb') as f:
+            prefix = f.read(PYGMENTS_PREFIX_BYTES)
+    except OSError:
+        return None
+    lang = _sniff_prefix(filepath, prefix)
+    if cache_key:
+        with _sniff_cache_lock:
+            _sniff_cache[cache_key] = lang
+            if len(_sniff_cache) > LANGUAGE_CACHE_SIZE:
+                _sniff_cache.popitem(last=False)
+    return lang
+
+def detect_languages_in_dir(directory, manifest=None):
+    if manifest is not None:
+        return {rel_path: entry['language'] for rel_path, entry in manifest.items() if not entry['skipped']}
     file_langs = {}
-    SKIP_DIRS = {'node_modules', '.git', 'dist', 'build', 'venv', '__pycache__', '.venv', '.mypy_cache', '.pytest_cache'}
     for root, dirs, files in os.walk(directory):
         # Remove skip dirs from traversal
         dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
@@ -0,0 +1,71 @@
+import os
+import hashlib
+import tempfile
+import threading
+import subprocess
+from functools import lru_cache
+from utils.disk_cache import DiskCache
+
+LINT_CACHE_ENABLED = os.getenv('LINT_CACHE_ENABLED', '1') == '1'
+LINT_CACHE_DIR = os.getenv('LINT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ai_code_reviewer_cache', 'lint'))
+LINT_CACHE_MAX_MB = int(os.getenv('LINT_CACHE_MAX_MB', 256))
+LINT_CACHE_MAX_BYTES = LINT_CACHE_MAX_MB * 1024 * 1024
+
+# Files that change what a linter reports, looked up in the server cwd and the reviewed tree's root
+LINTER_CONFIG_FILES = [
+    '.flake8', 'setup.cfg', 'tox.ini',
+    'eslint.config.js', 'eslint.config.mjs', 'eslint.config.cjs', '.eslintrc', '.eslintrc.json', '.eslintrc.js',
+    '.clang-tidy', 'checkstyle.xml',
+]
+
+_lock = threading.Lock()
+_store = DiskCache(LINT_CACHE_DIR, LINT_CACHE_MAX_BYTES)
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+@lru_cache(maxsize=None)
+def linter_version(tool):
+    try:
+        result = subprocess.run([tool, '--version'], capture_output=True, text=True, timeout=10)
+        return (result.stdout + result.stderr).strip()
+    except Exception:
+        return ''
+
+def config_fingerprint(directory):
+    h = hashlib.sha256()
+    for base in (os.getcwd(), directory):
+        for name in LINTER_CONFIG_FILES:
+            path = os.path.join(base, name)
+            if os.path.isfile(path):
+                h.update(name.encode())
+                h.update(file_hash(path).encode())
+    return h.hexdigest()
+
+def cache_key(content_hash, language, linter_id, config_id):
+    raw = '\0'.join([content_hash, language, linter_id, config_id])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def record(stats, hit):
+    if stats is None:
+        return
+    with _lock:
+        name = 'hits' if hit else 'misses'
+        stats[name] = stats.get(name, 0) + 1
+
+def get(key):
+    if not LINT_CACHE_ENABLED:
+        return None
+    return _store.get(key)
+
+def put(key, issues):
+    if not LINT_CACHE_ENABLED:
+        return
+    # Errors (timeouts, missing linters) are environmental, not a property of the content
+    if any('error' in issue for issue in issues):
+        return
+    _store.put(key, issues)
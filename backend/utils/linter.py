@@ -1,6 +1,14 @@
 import os
-import subprocess
 import json
+import contextvars
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.linter_workers import BATCH_LINTERS, run_batch, chunked, eslint_command
+from utils import lint_cache
+from utils.language_detect import is_skipped_path
+from utils.cancellation import run_process, check_cancelled
+from utils import metrics
 
 LINTER_COMMANDS = {
     'Python': lambda f: ['flake8', f],
@@ -14,12 +22,61 @@ LINTER_COMMANDS = {
 
 SUPPORTED_LANGUAGES = set(LINTER_COMMANDS.keys())
 
-def run_linter(file_path, language):
+LINTER_TIMEOUT = int(os.getenv('LINTER_TIMEOUT', 30))
+LINTER_PARALLEL = os.getenv('LINTER_PARALLEL', '1') == '1'
+LINTER_WORKERS = int(os.getenv('LINTER_WORKERS', os.cpu_count() or 1))
+LINTER_MAX_PER_LANGUAGE = int(os.getenv('LINTER_MAX_PER_LANGUAGE', 4))
+LINTER_DIR_TIMEOUT = int(os.getenv('LINTER_DIR_TIMEOUT', 600))
+
+# Shared by every session so concurrent jobs can't oversubscribe one linter
+_language_slots = {}
+_language_slots_lock = threading.Lock()
+
+def _language_slot(language):
+    with _language_slots_lock:
+        if language not in _language_slots:
+            _language_slots[language] = threading.BoundedSemaphore(LINTER_MAX_PER_LANGUAGE)
+        return _language_slots[language]
+
+def linter_identity(language):
+    # Command template, executable and version: anything that changes the output
+    if BATCH_LINTERS.get(language) == 'eslint':
+        tool = eslint_command()
+    else:
+        tool = LINTER_COMMANDS[language]('')[0]
+    template = ' '.join(LINTER_COMMANDS[language]('{file}'))
+    return f'{template}|{tool}|{lint_cache.linter_version(tool)}'
+
+def lint_cache_key(file_path, language, config_id, content_hash=None):
+    if not lint_cache.LINT_CACHE_ENABLED:
+        return None
+    try:
+        content_hash = content_hash or lint_cache.file_hash(file_path)
+    except OSError:
+        return None
+    return lint_cache.cache_key(content_hash, language, linter_identity(language), config_id)
+
+def run_linter(file_path, language, timeout=LINTER_TIMEOUT, stats=None, config_id=None):
     if language not in LINTER_COMMANDS:
         return []
+    if config_id is None and lint_cache.LINT_CACHE_ENABLED:
+        config_id = lint_cache.config_fingerprint(os.path.dirname(file_path))
+    key = lint_cache_key(file_path, language, config_id)
+    if key:
+        cached = lint_cache.get(key)
+        if cached is not None:
+            lint_cache.record(stats, True)
+            return cached
+    lint_cache.record(stats, False)
+    issues = _run_linter_process(file_path, language, timeout)
+    if key:
+        lint_cache.put(key, issues)
+    return issues
+
+def _run_linter_process(file_path, language, timeout):
     cmd = LINTER_COMMANDS[language](file_path)
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        result = run_process(cmd, timeout)
         output = result.stdout + result.stderr
         if result.returncode != 0 and 'eslint' in cmd[0]:
             # If ESLint fails, return the error message
@@ -38,13 +95,14 @@ def parse_linter_output(language, output):
                 _, line_no, col, msg = parts
                 issues.append({'line': int(line_no), 'col': int(col), 'message': msg.strip()})
         return issues
-    elif language == 'JavaScript':
+    elif language in ('JavaScript', 'TypeScript', 'TSX'):
         try:
             data = json.loads(output)
             issues = []
             for file_result in data:
                 for msg in file_result.get('messages', []):
-                    issues.append({'line': msg.get('line'), 'col': msg.get('column'), 'message': msg.get('message')})
+                    issues.append({'line': msg.get('line'), 'col': msg.get('column'), 'message': msg.get('message'),
+                                   'severity': msg.get('severity')})
             return issues
         except Exception:
             return [{'error': 'Failed to parse eslint output'}]
@@ -56,19 +114,111 @@ def parse_linter_output(language, output):
         return [{'info': 'C/C++ linter output parsing not implemented'}]
     return []
 
-def run_linters_on_dir(directory, lang_map):
+def _lint_before_deadline(abs_path, lang, deadline, key=None):
+    slot = _language_slot(lang)
+    if not slot.acquire(timeout=max(deadline - time.monotonic(), 0)):
+        return [{'error': 'Linting skipped: directory deadline exceeded'}]
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return [{'error': 'Linting skipped: directory deadline exceeded'}]
+        issues = _run_linter_process(abs_path, lang, min(LINTER_TIMEOUT, remaining))
+        if key:
+            lint_cache.put(key, issues)
+        return issues
+    finally:
+        slot.release()
+
+def _lint_batch_before_deadline(batch, lang, deadline, keys=None):
+    # batch is a list of (rel_path, abs_path); one linter invocation covers all of them
+    slot = _language_slot(lang)
+    if not slot.acquire(timeout=max(deadline - time.monotonic(), 0)):
+        return {rel_path: [{'error': 'Linting skipped: directory deadline exceeded'}] for rel_path, _ in batch}
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return {rel_path: [{'error': 'Linting skipped: directory deadline exceeded'}] for rel_path, _ in batch}
+        try:
+            outputs, error = run_batch(lang, [abs_path for _, abs_path in batch], min(LINTER_TIMEOUT * len(batch), remaining))
+        except Exception as e:
+            return {rel_path: [{'error': str(e)}] for rel_path, _ in batch}
+        if error:
+            return {rel_path: [{'error': error}] for rel_path, _ in batch}
+        results = {rel_path: parse_linter_output(lang, outputs[abs_path]) for rel_path, abs_path in batch}
+        for rel_path, issues in results.items():
+            if keys and keys.get(rel_path):
+                lint_cache.put(keys[rel_path], issues)
+        return results
+    finally:
+        slot.release()
+
+def run_linters_on_dir(directory, lang_map, parallel=None, stats=None, manifest=None, on_result=None):
+    if manifest is not None:
+        # The manifest already pruned ignored directories and hashed every file
+        targets = [(rel_path, entry['language']) for rel_path, entry in sorted(manifest.items())
+                   if entry['supported'] and not entry['skipped']]
+    else:
+        targets = [(rel_path, lang) for rel_path, lang in sorted(lang_map.items())
+                   if lang in SUPPORTED_LANGUAGES and not is_skipped_path(rel_path)]
+    parallel = LINTER_PARALLEL if parallel is None else parallel
+    deadline = time.monotonic() + LINTER_DIR_TIMEOUT
+    # Cache hits never reach a linter process
     results = {}
-    SKIP_DIRS = {'node_modules', '.git', 'dist', 'build', 'venv', '__pycache__', '.venv', '.mypy_cache', '.pytest_cache'}
-    for rel_path, lang in lang_map.items():
-        # Skip files in ignored directories
-        parts = rel_path.split(os.sep)
-        if any(part in SKIP_DIRS for part in parts):
-            continue
-        if lang in SUPPORTED_LANGUAGES:
-            abs_path = os.path.join(directory, rel_path)
-            issues = run_linter(abs_path, lang)
-            results[rel_path] = issues
-    return results
+    keys = {}
+    config_id = lint_cache.config_fingerprint(directory) if lint_cache.LINT_CACHE_ENABLED else None
+    pending = []
+    for rel_path, lang in targets:
+        content_hash = manifest[rel_path]['sha256'] if manifest is not None else None
+        key = lint_cache_key(os.path.join(directory, rel_path), lang, config_id, content_hash)
+        cached = lint_cache.get(key) if key else None
+        lint_cache.record(stats, cached is not None)
+        if cached is not None:
+            results[rel_path] = cached
+            if on_result:
+                on_result(rel_path, cached)
+        else:
+            keys[rel_path] = key
+            pending.append((rel_path, lang))
+    # Languages with a batch worker share one linter run per chunk of files
+    tasks = []
+    by_language = {}
+    for rel_path, lang in pending:
+        if lang in BATCH_LINTERS:
+            by_language.setdefault(lang, []).append((rel_path, os.path.join(directory, rel_path)))
+        else:
+            tasks.append((_lint_before_deadline, os.path.join(directory, rel_path), lang, rel_path, keys[rel_path]))
+    for lang, files in by_language.items():
+        for batch in chunked(files):
+            tasks.append((_lint_batch_before_deadline, batch, lang, None, keys))
+    def run_task(fn, arg, lang, rel_path, key):
+        check_cancelled()
+        start = time.perf_counter()
+        outcome = fn(arg, lang, deadline, key)
+        if rel_path is not None:
+            label = rel_path
+        else:
+            # A batch is one linter run; it is charged to its first file
+            label = arg[0][0] if len(arg) == 1 else f'{arg[0][0]} (+{len(arg) - 1} files)'
+        metrics.record_file('lint', label, time.perf_counter() - start)
+        # A cancelled job's killed linters report errors; don't pass those on as results
+        check_cancelled()
+        outcome = {rel_path: outcome} if rel_path is not None else outcome
+        # Report each file as soon as its linter finishes so later stages can start on it
+        if on_result:
+            for done_path, issues in outcome.items():
+                on_result(done_path, issues)
+        return outcome
+    if not parallel or LINTER_WORKERS <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            results.update(run_task(*task))
+    else:
+        with ThreadPoolExecutor(max_workers=min(LINTER_WORKERS, len(tasks))) as pool:
+            # Each task gets its own copy of the context so the job's cancel token reaches the pool threads
+            futures = [pool.submit(contextvars.copy_context().run, run_task, *task) for task in tasks]
+        for future in futures:
+            results.update(future.result())
+    # Emit in sorted path order so linter_results.json doesn't depend on completion order
+    return {rel_path: results[rel_path] for rel_path, _ in targets}
 
 def save_linter_results(directory, results):
     out_path = os.path.join(directory, 'linter_results.json')
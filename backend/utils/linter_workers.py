@@ -0,0 +1,205 @@
+import os
+import re
+import json
+import sys
+import shutil
+import threading
+import subprocess
+from utils import metrics
+from utils.cancellation import JobCancelled, _kill, check_cancelled, current_token, run_process
+
+try:
+    from flake8.api import legacy as flake8_legacy
+    from flake8.formatting.base import BaseFormatter
+except ImportError:
+    flake8_legacy = None
+    BaseFormatter = object
+
+LINTER_BATCH_SIZE = int(os.getenv('LINTER_BATCH_SIZE', 50))
+# Set to 0 to always shell out to flake8 even when it is importable
+FLAKE8_IN_PROCESS = os.getenv('FLAKE8_IN_PROCESS', '1') == '1'
+# Warm flake8 workers kept between batches; matches the per-language linter cap by default
+FLAKE8_POOL_SIZE = int(os.getenv('FLAKE8_POOL_SIZE', os.getenv('LINTER_MAX_PER_LANGUAGE', 4)))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FLAKE8_LINE_RE = re.compile(r'^(.*?):(\d+):(\d+): (.*)$')
+
+class _CollectingFormatter(BaseFormatter):
+    # flake8 instantiates the formatter itself, so results go to a sink on the class; each worker process has its own
+    sink = None
+
+    def start(self):
+        pass
+
+    def handle(self, error):
+        _CollectingFormatter.sink.setdefault(os.path.normpath(error.filename), []).append(
+            f'{error.filename}:{error.line_number}:{error.column_number}: {error.code} {error.text}')
+
+    def stop(self):
+        pass
+
+def _get_flake8_guide():
+    kwargs = {}
+    try:
+        # The worker is the checker; don't let flake8 fork a pool of its own
+        from flake8.main.options import JobsArgument
+        kwargs['jobs'] = JobsArgument('1')
+    except ImportError:
+        pass
+    guide = flake8_legacy.get_style_guide(**kwargs)
+    guide.init_report(_CollectingFormatter)
+    return guide
+
+def _flake8_worker_main():
+    # `python -m utils.linter_workers`: one warm style guide, a JSON {cwd, paths} request per line in,
+    # a JSON {outputs: {path: output}} (or {error}) per line out
+    guide = _get_flake8_guide()
+    for line in sys.stdin:
+        request = json.loads(line)
+        paths = request['paths']
+        _CollectingFormatter.sink = {}
+        try:
+            # Paths are relative to the caller, like on the flake8 command line
+            os.chdir(request['cwd'])
+            guide.check_files(paths)
+            collected = _CollectingFormatter.sink
+            reply = {'outputs': {path: '\n'.join(collected.get(os.path.normpath(path), [])) for path in paths}}
+        except Exception as e:
+            reply = {'error': str(e)}
+        sys.stdout.write(json.dumps(reply) + '\n')
+        sys.stdout.flush()
+
+class _Flake8Worker:
+    def __init__(self):
+        metrics.count('subprocesses', tool='flake8-worker')
+        self.proc = subprocess.Popen([sys.executable, '-m', 'utils.linter_workers'], cwd=BACKEND_DIR,
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     text=True, start_new_session=os.name == 'posix')
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def kill(self):
+        _kill(self.proc)
+        self.proc.wait()
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+
+# Idle warm workers; a worker lints one batch at a time, so batches run in parallel up to the
+# linter's per-language cap and a stuck batch is killed without touching the others
+_flake8_idle = []
+_flake8_pool_lock = threading.Lock()
+
+def _checkout_flake8_worker():
+    with _flake8_pool_lock:
+        while _flake8_idle:
+            worker = _flake8_idle.pop()
+            if worker.alive():
+                return worker
+            worker.kill()
+    return _Flake8Worker()
+
+def _checkin_flake8_worker(worker):
+    with _flake8_pool_lock:
+        if len(_flake8_idle) < FLAKE8_POOL_SIZE:
+            _flake8_idle.append(worker)
+            return
+    worker.kill()
+
+def _run_flake8_in_process(paths, timeout):
+    # Same output as the subprocess path without starting flake8 cold for every batch. The
+    # timeout and the job's cancel token kill the worker the same way they kill a linter process.
+    worker = _checkout_flake8_worker()
+    token = current_token()
+    timed_out = threading.Event()
+    def expire():
+        timed_out.set()
+        _kill(worker.proc)
+    timer = threading.Timer(timeout, expire)
+    if token is not None:
+        token._track(worker.proc)
+    timer.start()
+    try:
+        worker.proc.stdin.write(json.dumps({'cwd': os.getcwd(), 'paths': list(paths)}) + '\n')
+        worker.proc.stdin.flush()
+        line = worker.proc.stdout.readline()
+    except OSError:
+        line = ''
+    finally:
+        timer.cancel()
+        if token is not None:
+            token._untrack(worker.proc)
+    if not line:
+        worker.kill()
+        check_cancelled()
+        if timed_out.is_set():
+            metrics.count('subprocess_timeouts', tool='flake8-worker')
+            raise subprocess.TimeoutExpired(['flake8', *paths], timeout)
+        raise RuntimeError('flake8 worker exited')
+    _checkin_flake8_worker(worker)
+    reply = json.loads(line)
+    if 'error' in reply:
+        raise RuntimeError(reply['error'])
+    return reply['outputs']
+
+def _run_flake8_subprocess(paths, timeout):
+    result = run_process(['flake8', *paths], timeout)
+    by_file = {os.path.normpath(path): [] for path in paths}
+    for line in (result.stdout + result.stderr).splitlines():
+        match = FLAKE8_LINE_RE.match(line)
+        if match and os.path.normpath(match.group(1)) in by_file:
+            by_file[os.path.normpath(match.group(1))].append(line)
+    return {path: '\n'.join(by_file[os.path.normpath(path)]) for path in paths}
+
+def lint_python_batch(paths, timeout):
+    if flake8_legacy is not None and FLAKE8_IN_PROCESS:
+        try:
+            return _run_flake8_in_process(paths, timeout)
+        except (subprocess.TimeoutExpired, JobCancelled):
+            raise
+        except Exception:
+            pass
+    return _run_flake8_subprocess(paths, timeout)
+
+def eslint_command():
+    # eslint_d keeps a warm eslint daemon alive between calls and sessions
+    return 'eslint_d' if shutil.which('eslint_d') else 'eslint'
+
+def lint_eslint_batch(paths, timeout):
+    result = run_process([eslint_command(), '--format', 'json', *paths], timeout)
+    try:
+        data = json.loads(result.stdout)
+    except ValueError:
+        # Exit code 2 means eslint itself failed (bad config, crash)
+        output = result.stdout + result.stderr
+        return {path: None for path in paths}, f'ESLint failed: {output}'
+    by_file = {os.path.normpath(file_result.get('filePath', '')): file_result for file_result in data}
+    outputs = {}
+    for path in paths:
+        file_result = by_file.get(os.path.normpath(os.path.abspath(path)), {'messages': []})
+        outputs[path] = json.dumps([file_result])
+    return outputs, None
+
+BATCH_LINTERS = {
+    'Python': 'flake8',
+    'JavaScript': 'eslint',
+    'TypeScript': 'eslint',
+    'TSX': 'eslint',
+}
+
+def run_batch(language, paths, timeout):
+    # Returns ({path: raw linter output}, error); raw output is parsed by the caller
+    if BATCH_LINTERS.get(language) == 'flake8':
+        return lint_python_batch(paths, timeout), None
+    if BATCH_LINTERS.get(language) == 'eslint':
+        return lint_eslint_batch(paths, timeout)
+    raise ValueError(f'No batch linter for {language}')
+
+def chunked(items, size=None):
+    size = size or LINTER_BATCH_SIZE
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+if __name__ == '__main__':
+    _flake8_worker_main()
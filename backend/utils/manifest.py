@@ -0,0 +1,71 @@
+import os
+import json
+import time
+from utils.language_detect import SKIP_DIRS, detect_language_by_extension, detect_language_by_content
+from utils.linter import SUPPORTED_LANGUAGES
+from utils.lint_cache import file_hash
+from utils import metrics
+
+# Pipeline outputs written into the session root; never part of the reviewed tree
+SESSION_ARTIFACTS = {
+    'status.json', 'file_manifest.json', 'file_languages.json', 'linter_results.json',
+    'rag_context.json', 'ai_log.json', 'review_report.md', 'patch.diff', 'session_package.zip', 'events.ndjson',
+    'results.db', 'session_artifacts.zip', 'profile.pstats', 'profile.txt', 'memory_profile.txt',
+}
+
+def _scan(directory):
+    # os.scandir hands back stat results with the listing, so one pass covers everything
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        with os.scandir(current) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS:
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+def build_manifest(directory, exclude=None):
+    exclude = set(exclude or ())
+    manifest = {}
+    for entry in _scan(directory):
+        rel_path = os.path.relpath(entry.path, directory)
+        st = entry.stat(follow_symlinks=False)
+        record = {'size': st.st_size, 'mtime': st.st_mtime, 'sha256': None, 'language': 'Unknown',
+                  'supported': False, 'skipped': False}
+        if rel_path in SESSION_ARTIFACTS or rel_path in exclude:
+            record['skipped'] = True
+            manifest[rel_path] = record
+            continue
+        try:
+            record['sha256'] = file_hash(entry.path)
+        except OSError:
+            record['skipped'] = True
+            manifest[rel_path] = record
+            continue
+        lang = detect_language_by_extension(entry.name)
+        if not lang:
+            # Content sniffing can fall through to Pygments, which is slow on some inputs
+            start = time.perf_counter()
+            lang = detect_language_by_content(entry.path, content_hash=record['sha256'])
+            metrics.record_file('detect_languages', rel_path, time.perf_counter() - start)
+        record['language'] = lang or 'Unknown'
+        record['supported'] = record['language'] in SUPPORTED_LANGUAGES
+        manifest[rel_path] = record
+    return dict(sorted(manifest.items()))
+
+def supported_files(manifest):
+    return [rel_path for rel_path, entry in manifest.items() if entry['supported'] and not entry['skipped']]
+
+def save_manifest(directory, manifest):
+    out_path = os.path.join(directory, 'file_manifest.json')
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+def load_manifest(directory):
+    path = os.path.join(directory, 'file_manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,273 @@
+import os
+import time
+import pstats
+import bisect
+import cProfile
+import threading
+import contextlib
+import contextvars
+import tracemalloc
+
+# Slowest files kept per stage in status.json; the histograms on /metrics see every file
+METRICS_SLOW_FILES = int(os.getenv('METRICS_SLOW_FILES', 10))
+# Opt-in per-session profiling: 'cpu' (cProfile), 'memory' (tracemalloc) or 'cpu,memory'
+SESSION_PROFILE = {mode.strip() for mode in os.getenv('SESSION_PROFILE', '').split(',') if mode.strip()}
+SESSION_PROFILE_TOP = int(os.getenv('SESSION_PROFILE_TOP', 50))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Prometheus metric names, with the help line /metrics prints for each
+METRIC_HELP = {
+    'review_stage_seconds': ('histogram', 'Time spent in each pipeline stage.'),
+    'review_file_seconds': ('histogram', 'Per-file (or per-batch) work within a stage.'),
+    'review_session_seconds': ('histogram', 'Wall time of a review job, by outcome.'),
+    'review_queue_wait_seconds': ('histogram', 'Time a job waited in the queue before a worker claimed it.'),
+    'review_http_request_seconds': ('histogram', 'HTTP request handling time.'),
+    'review_sessions_total': ('counter', 'Review jobs finished, by outcome.'),
+    'review_subprocesses_total': ('counter', 'External tool processes started.'),
+    'review_subprocess_timeouts_total': ('counter', 'External tool processes killed on timeout.'),
+    'review_extracted_bytes_total': ('counter', 'Bytes written into session directories from ZIPs and repositories.'),
+    'review_upload_bytes_total': ('counter', 'Bytes of ZIP uploads accepted.'),
+    'review_lint_issues_total': ('counter', 'Linter issues reported.'),
+    'review_ai_findings_total': ('counter', 'AI review findings produced.'),
+    'review_cache_requests_total': ('counter', 'Cache lookups, by cache and result.'),
+    'review_prompt_tokens_total': ('counter', 'Estimated tokens sent to the review backend.'),
+}
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    # Process-wide counters and histograms; each process (Flask, worker.py) exposes its own
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def render(self, gauges=None):
+        # Prometheus text exposition format 0.0.4; gauges are sampled by the caller at scrape time
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {**value, 'buckets': list(value['buckets'])} for key, value in self._histograms.items()}
+        lines = []
+        def header(name, kind):
+            help_text = METRIC_HELP.get(name, (kind, name))[1]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+        for name in sorted({name for name, _ in counters}):
+            header(name, 'counter')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for name in sorted({name for name, _ in histograms}):
+            header(name, 'histogram')
+            for (metric, labels), value in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, value['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", _format_value(float(bound)))])} {cumulative}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value["count"]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value["sum"])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+        for name, (help_text, samples) in sorted((gauges or {}).items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(_label_key(labels))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+class SessionMetrics:
+    # One job's breakdown, persisted into status.json under 'timings'. Stages overlap
+    # (linting streams into retrieval and review), so they can add up to more than total_seconds.
+    def __init__(self, slow_files=METRICS_SLOW_FILES):
+        self.slow_files = slow_files
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._stages = {}
+        self._counters = {}
+        self._files = {}
+        self._caches = {}
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def add_file(self, stage, rel_path, seconds):
+        with self._lock:
+            slowest = self._files.setdefault(stage, [])
+            if len(slowest) < self.slow_files or seconds > slowest[0][0]:
+                bisect.insort(slowest, (seconds, rel_path))
+                if len(slowest) > self.slow_files:
+                    slowest.pop(0)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_cache(self, cache, hits, misses):
+        with self._lock:
+            self._caches[cache] = {'hits': hits, 'misses': misses,
+                                   'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0}
+
+    def elapsed(self):
+        return time.monotonic() - self._started
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'total_seconds': round(self.elapsed(), 4),
+                'stages': {stage: round(seconds, 4) for stage, seconds in self._stages.items()},
+                'counters': dict(self._counters),
+                'caches': {cache: dict(stats) for cache, stats in self._caches.items()},
+                'slowest_files': {stage: [{'file': rel_path, 'seconds': round(seconds, 4)} for seconds, rel_path in reversed(slowest)]
+                                  for stage, slowest in self._files.items()},
+            }
+
+# The running job's breakdown follows the work into lint threads the same way its cancel token does
+_current = contextvars.ContextVar('session_metrics', default=None)
+
+def current_metrics():
+    return _current.get()
+
+def activate(session_metrics):
+    return _current.set(session_metrics)
+
+def deactivate(reset):
+    _current.reset(reset)
+
+@contextlib.contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def record_stage(name, seconds):
+    registry.observe('review_stage_seconds', seconds, stage=name)
+    session_metrics = _current.get()
+    if session_metrics is not None:
+        session_metrics.add_stage(name, seconds)
+
+def record_file(stage_name, rel_path, seconds):
+    registry.observe('review_file_seconds', seconds, stage=stage_name)
+    session_metrics = _current.get()
+    if session_metrics is not None:
+        session_metrics.add_file(stage_name, rel_path, seconds)
+
+def count(name, value=1, **labels):
+    # review_<name>_total on /metrics, <name> in the session's counters
+    registry.inc(f'review_{name}_total', value, **labels)
+    session_metrics = _current.get()
+    if session_metrics is not None:
+        session_metrics.inc(name, value)
+
+def record_cache(cache, hits, misses):
+    if hits:
+        registry.inc('review_cache_requests_total', hits, cache=cache, result='hit')
+    if misses:
+        registry.inc('review_cache_requests_total', misses, cache=cache, result='miss')
+    session_metrics = _current.get()
+    if session_metrics is not None:
+        session_metrics.set_cache(cache, hits, misses)
+
+def timings_snapshot():
+    session_metrics = _current.get()
+    return session_metrics.snapshot() if session_metrics is not None else None
+
+# cProfile allows one active profiler per process (3.12+ raises on a second) and tracemalloc is
+# process-wide, so one session is profiled at a time; overlapping ones get a note instead
+_profile_lock = threading.Lock()
+
+def _write_profile_note(session_dir, modes, note):
+    names = (['profile.txt'] if 'cpu' in modes else []) + (['memory_profile.txt'] if 'memory' in modes else [])
+    for name in names:
+        with open(os.path.join(session_dir, name), 'w', encoding='utf-8') as f:
+            f.write(note + '\n')
+
+@contextlib.contextmanager
+def profile_session(session_dir, modes=None):
+    # cProfile sees only the calling (worker) thread; linters run in pool threads and
+    # subprocesses, which the stage and per-file timings cover. The files land just after
+    # the session reports 'complete'.
+    modes = SESSION_PROFILE if modes is None else modes
+    if not modes:
+        yield
+        return
+    if not _profile_lock.acquire(blocking=False):
+        try:
+            yield
+        finally:
+            try:
+                # A cancelled session's directory is already gone
+                if os.path.isdir(session_dir):
+                    _write_profile_note(session_dir, modes, 'Not profiled: another session was being profiled at the same time.')
+            except OSError:
+                pass
+        return
+    profiler = cProfile.Profile() if 'cpu' in modes else None
+    tracing = 'memory' in modes and not tracemalloc.is_tracing()
+    try:
+        if tracing:
+            tracemalloc.start()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            try:
+                if profiler and os.path.isdir(session_dir):
+                    profiler.dump_stats(os.path.join(session_dir, 'profile.pstats'))
+                    with open(os.path.join(session_dir, 'profile.txt'), 'w', encoding='utf-8') as f:
+                        pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(SESSION_PROFILE_TOP)
+                if 'memory' in modes and os.path.isdir(session_dir):
+                    if tracing:
+                        snapshot = tracemalloc.take_snapshot()
+                        current, peak = tracemalloc.get_traced_memory()
+                        with open(os.path.join(session_dir, 'memory_profile.txt'), 'w', encoding='utf-8') as f:
+                            f.write(f'current: {current / 1048576:.2f} MB\npeak: {peak / 1048576:.2f} MB\n\n')
+                            for stat in snapshot.statistics('lineno')[:SESSION_PROFILE_TOP]:
+                                f.write(f'{stat}\n')
+                    else:
+                        _write_profile_note(session_dir, {'memory'}, 'Not profiled: tracemalloc was already started outside the session profiler.')
+            except OSError:
+                pass
+            finally:
+                if tracing:
+                    tracemalloc.stop()
+    finally:
+        _profile_lock.release()
@@ -1,5 +1,9 @@
 import os
 import json
+import logging
+from unidiff import PatchSet
+from unidiff.errors import UnidiffParseError
+from utils.file_reader import SessionFiles
 
 def generate_pr_comments(ai_log):
     comments = []
@@ -7,9 +11,147 @@ def generate_pr_comments(ai_log):
         comments.append(f"""File: {entry['file']}\nLine: {entry['line']}\n Issue: {entry['issue']}\n Suggestion: {entry['suggestion']}\n Current:\n    {entry['current_code']}\n Fix:\n    {entry['recommended_code']}\n""")
     return '\n---\n'.join(comments)
 
-def generate_patch_file(ai_log):
-    patches = [entry['patch'] for entry in ai_log if 'patch' in entry]
-    return '\n'.join(patches)
+DIFF_CONTEXT_LINES = int(os.getenv('DIFF_CONTEXT_LINES', 3))
+NO_NEWLINE = '\\ No newline at end of file\n'
+
+def _line_ending(line):
+    stripped = line.rstrip('\r\n')
+    return line[len(stripped):]
+
+def entry_edit(lines, entry):
+    # (start, end, new_lines) for one applicable suggestion, 0-based and end-exclusive; None when it does not apply
+    current = entry.get('current_code', '')
+    recommended = entry.get('recommended_code', current)
+    if recommended == current or not current or not isinstance(entry.get('line'), int):
+        return None
+    old = current.splitlines()
+    start = entry['line'] - 1
+    end = start + len(old)
+    # current_code is the stripped source line; skip suggestions whose code no longer matches the file
+    if start < 0 or end > len(lines) or [l.strip() for l in lines[start:end]] != [l.strip() for l in old]:
+        return None
+    original = lines[start]
+    indent = original[:len(original) - len(original.lstrip())]
+    ending = _line_ending(lines[end - 1]) or _line_ending(original) or '\n'
+    new_lines = [(indent + l if l.strip() else l) + ending for l in recommended.splitlines()]
+    if new_lines and not _line_ending(lines[end - 1]):
+        new_lines[-1] = new_lines[-1].rstrip('\r\n')
+    return start, end, new_lines
+
+def file_edits(lines, entries):
+    edits = [edit for edit in (entry_edit(lines, entry) for entry in entries) if edit is not None]
+    edits.sort(key=lambda edit: edit[0])
+    merged = []
+    for edit in edits:
+        # Overlapping suggestions for the same lines conflict; the first one wins
+        if merged and edit[0] < merged[-1][1]:
+            continue
+        merged.append(edit)
+    return merged
+
+def build_hunks(lines, edits, context=DIFF_CONTEXT_LINES):
+    # Edits whose context windows touch are merged into one hunk
+    groups = []
+    for edit in edits:
+        if groups and edit[0] - groups[-1][-1][1] <= 2 * context:
+            groups[-1].append(edit)
+        else:
+            groups.append([edit])
+    hunks = []
+    offset = 0
+    for group in groups:
+        start = max(group[0][0] - context, 0)
+        end = min(group[-1][1] + context, len(lines))
+        body = []
+        pos = start
+        added = removed = 0
+        for edit_start, edit_end, new_lines in group:
+            body.extend(' ' + l for l in lines[pos:edit_start])
+            body.extend('-' + l for l in lines[edit_start:edit_end])
+            body.extend('+' + l for l in new_lines)
+            removed += edit_end - edit_start
+            added += len(new_lines)
+            pos = edit_end
+        body.extend(' ' + l for l in lines[pos:end])
+        source_length = end - start
+        target_length = source_length - removed + added
+        hunks.append((start + 1, source_length, start + 1 + offset, target_length, body))
+        offset += added - removed
+    return hunks
+
+def format_file_patch(rel_path, hunks):
+    out = [f'--- a/{rel_path}\n', f'+++ b/{rel_path}\n']
+    for source_start, source_length, target_start, target_length, body in hunks:
+        # Empty ranges point at the line before, as diff -u does
+        if source_length == 0:
+            source_start -= 1
+        if target_length == 0:
+            target_start -= 1
+        out.append(f'@@ -{source_start},{source_length} +{target_start},{target_length} @@\n')
+        for line in body:
+            if line.endswith('\n'):
+                out.append(line)
+            else:
+                out.append(line + '\n' + NO_NEWLINE)
+    return ''.join(out)
+
+def validate_file_patch(text, lines):
+    # The patch must parse with consistent hunk counts and its source side must match the original file
+    try:
+        patched_file = PatchSet(text)[0]
+    except (UnidiffParseError, IndexError):
+        return False
+    for hunk in patched_file:
+        source = []
+        hunk_lines = list(hunk)
+        for i, line in enumerate(hunk_lines):
+            if not (line.is_context or line.is_removed):
+                continue
+            value = line.value
+            if i + 1 < len(hunk_lines) and hunk_lines[i + 1].line_type == '\\':
+                value = value[:-1]
+            source.append(value)
+        start = max(hunk.source_start - 1, 0)
+        if lines[start:start + len(source)] != source:
+            return False
+    return True
+
+def write_patch_file(directory, ai_log, patch_path=None, files=None):
+    # Streams one validated patch per file, so memory follows the largest file rather than the whole review.
+    # Also sets each ai_log entry's patch; entries whose edit was not applied get an empty one.
+    if patch_path is None:
+        patch_path = os.path.join(directory, 'patch.diff')
+    by_file = {}
+    for entry in ai_log:
+        entry['patch'] = ''
+        by_file.setdefault(entry['file'], []).append(entry)
+    stats = {'files': 0, 'hunks': 0, 'rejected': 0}
+    session_files = files or SessionFiles(directory)
+    with open(patch_path, 'w', encoding='utf-8', newline='') as f:
+        for rel_path in sorted(by_file):
+            with session_files.open(rel_path) as lines:
+                if lines is None:
+                    continue
+                edits = file_edits(lines, by_file[rel_path])
+                hunks = build_hunks(lines, edits)
+                if not hunks:
+                    continue
+                text = format_file_patch(rel_path, hunks)
+                if not validate_file_patch(text, lines):
+                    logging.warning(f'Dropped patch for {rel_path}: does not apply to the original file')
+                    stats['rejected'] += 1
+                    continue
+                f.write(text)
+                stats['files'] += 1
+                stats['hunks'] += len(hunks)
+                # Each entry carries the hunk for its own edit, cut from the same validated file patch
+                for entry in by_file[rel_path]:
+                    edit = entry_edit(lines, entry)
+                    if edit is not None and edit in edits:
+                        entry['patch'] = format_file_patch(rel_path, build_hunks(lines, [edit]))
+    if files is None:
+        session_files.close()
+    return stats
 
 def calculate_code_quality_score(linter_results, ai_log):
     # Simple scoring: 100 - (# linter issues * 2) - (# AI issues * 3)
@@ -22,8 +164,3 @@ def save_report(directory, pr_comments, score):
     report_path = os.path.join(directory, 'review_report.md')
     with open(report_path, 'w', encoding='utf-8') as f:
         f.write(f"# Code Review Report\n\n## Code Quality Score: {score}/100\n\n## PR-Style Comments\n\n{pr_comments}\n")
-
-def save_patch_file(directory, patch_content):
-    patch_path = os.path.join(directory, 'patch.diff')
-    with open(patch_path, 'w', encoding='utf-8') as f:
-        f.write(patch_content) 
\ No newline at end of file
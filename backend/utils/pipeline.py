@@ -0,0 +1,255 @@
+import os
+import json
+import queue
+import threading
+import contextvars
+from utils.file_ops import clone_github_repo, extract_zip, ZipRejected
+from utils.language_detect import detect_languages_in_dir, save_language_map
+from utils.linter import run_linters_on_dir, save_linter_results, linter_identity
+from utils.manifest import build_manifest, save_manifest, supported_files
+from utils.rag import run_rag_on_linter_results, save_rag_context
+from utils.ai_review import run_ai_review_on_rag, save_ai_log, load_ai_log, AI_REVIEW_BACKEND
+from utils.review_engine import PROMPT_VERSION
+from utils.retriever import RETRIEVER_BACKEND
+from utils.results_store import tree_key, restore_results, store_results, claim_tree, release_tree, record_alias
+from utils.repo_mirror import last_review, record_review, changed_files
+from utils.review_cache import new_stats, finish_stats
+from utils.patch import generate_pr_comments, write_patch_file, calculate_code_quality_score, save_report
+from utils.session import set_session_status
+from utils.events import append_event
+from utils.file_reader import SessionFiles
+from utils.cancellation import CancelToken, activate, deactivate, check_cancelled, current_token
+from utils.results_db import write_results_db
+from utils.context_packer import new_token_stats, finish_token_stats
+from utils import metrics
+
+# Re-review only files changed since the last reviewed commit of the same repo
+GITHUB_INCREMENTAL = os.getenv('GITHUB_INCREMENTAL', '1') == '1'
+
+# Files reviewed together once their lint results are in; small keeps the stream responsive
+STREAM_CHUNK_FILES = int(os.getenv('STREAM_CHUNK_FILES', 8))
+
+class PipelineError(Exception):
+    pass
+
+def prepare_sources(session_dir, job):
+    # Materialize the job input inside the session directory
+    if job['type'] == 'zip':
+        try:
+            with metrics.stage('extract'):
+                extracted, skipped = extract_zip(job['zip_path'], session_dir)
+        except ZipRejected as e:
+            raise PipelineError(str(e))
+        if not extracted:
+            raise PipelineError('No files could be extracted from the ZIP. The archive may be empty, corrupted, or all files were skipped due to errors.')
+    elif job['type'] == 'github':
+        try:
+            with metrics.stage('clone'):
+                job['commit'] = clone_github_repo(job['github_url'], session_dir)
+        except Exception as e:
+            raise PipelineError(f'GitHub clone failed: {str(e)}')
+
+def restore_submission(session_dir, job, key):
+    # Repeat of a finished submission: the same session layout (sources, manifest and
+    # artifacts) without running any stage. False when it has to go through the pipeline.
+    try:
+        prepare_sources(session_dir, job)
+    except PipelineError:
+        return False
+    return restore_results(key, session_dir)
+
+def previous_review(job, manifest):
+    # Results of the last review of this repo for files that still exist unchanged, or None
+    if job['type'] != 'github' or not job.get('incremental', GITHUB_INCREMENTAL):
+        return None
+    previous = last_review(job['github_url'])
+    if not previous or not os.path.isdir(previous['session_dir']):
+        return None
+    changed = changed_files(job['github_url'], previous['commit'], job['commit'])
+    if changed is None:
+        return None
+    try:
+        with open(os.path.join(previous['session_dir'], 'linter_results.json'), 'r', encoding='utf-8') as f:
+            prev_linter = json.load(f)
+        with open(os.path.join(previous['session_dir'], 'rag_context.json'), 'r', encoding='utf-8') as f:
+            prev_rag = json.load(f)
+        prev_ai, _ = load_ai_log(previous['session_dir'])
+    except (OSError, ValueError):
+        return None
+    keep = {rel_path for rel_path in prev_linter
+            if rel_path in manifest and not manifest[rel_path]['skipped'] and rel_path not in changed}
+    return {
+        'base_commit': previous['commit'],
+        'changed': changed,
+        'linter_results': {rel_path: prev_linter[rel_path] for rel_path in keep},
+        'rag_context': {rel_path: prev_rag[rel_path] for rel_path in keep if rel_path in prev_rag},
+        'ai_results': [entry for entry in prev_ai if entry['file'] in keep],
+    }
+
+def pipeline_versions(manifest):
+    versions = {'prompt': PROMPT_VERSION, 'review_backend': AI_REVIEW_BACKEND, 'retriever': RETRIEVER_BACKEND}
+    for lang in sorted({entry['language'] for entry in manifest.values() if entry['supported'] and not entry['skipped']}):
+        versions[f'linter:{lang}'] = linter_identity(lang)
+    return versions
+
+def run_review_pipeline(session_dir, session_id, job):
+    # Carried into every status update so pollers keep seeing earlier stage details
+    details = {}
+    set_session_status(session_dir, 'detecting')
+    prepare_sources(session_dir, job)
+    check_cancelled()
+    # Single scan of the tree; every later stage reads the manifest instead of re-walking
+    exclude = [os.path.relpath(job['zip_path'], session_dir)] if job['type'] == 'zip' else []
+    with metrics.stage('manifest'):
+        manifest = build_manifest(session_dir, exclude=exclude)
+    if job['type'] == 'zip' and not supported_files(manifest):
+        raise PipelineError('No supported code files found in the ZIP. The archive may only contain dependencies or unsupported files.')
+    save_manifest(session_dir, manifest)
+    # Identical trees are answered from the results store; concurrent ones wait for the first run
+    key = tree_key(manifest, pipeline_versions(manifest))
+    while True:
+        if restore_results(key, session_dir, exclude={'file_manifest.json'}):
+            details['results_store'] = 'hit'
+            metrics.record_cache('results_store', 1, 0)
+            set_session_status(session_dir, 'packaging', details)
+            _finish(session_dir, session_id, job, key, details)
+            return
+        event, owner = claim_tree(key)
+        if owner:
+            break
+        set_session_status(session_dir, 'queued', {'waiting_for': 'identical submission'})
+        with metrics.stage('identical_wait'):
+            while not event.wait(1):
+                check_cancelled()
+    metrics.record_cache('results_store', 0, 1)
+    try:
+        _run_stages(session_dir, job, manifest, details)
+        with metrics.stage('results_store'):
+            store_results(key, session_dir)
+    finally:
+        release_tree(key)
+    details['results_store'] = 'miss'
+    _finish(session_dir, session_id, job, key, details)
+
+def _run_stages(session_dir, job, manifest, details):
+    # One line-indexed view per file, shared by RAG, review and patch generation
+    with SessionFiles(session_dir) as files:
+        _review_files(session_dir, job, manifest, details, files)
+
+def _review_files(session_dir, job, manifest, details, files):
+    # Language detection
+    with metrics.stage('detect_languages'):
+        lang_map = detect_languages_in_dir(session_dir, manifest=manifest)
+    save_language_map(session_dir, lang_map)
+    carried = previous_review(job, manifest) or {'linter_results': {}, 'rag_context': {}, 'ai_results': []}
+    review_manifest = manifest
+    if carried['linter_results']:
+        details['incremental'] = {'base_commit': carried['base_commit'], 'changed_files': len(carried['changed']),
+                                  'carried_forward': len(carried['linter_results'])}
+        review_manifest = {rel_path: entry for rel_path, entry in manifest.items() if rel_path not in carried['linter_results']}
+        for rel_path, issues in carried['linter_results'].items():
+            append_event(session_dir, 'lint', {'file': rel_path, 'issues': issues, 'carried_forward': True})
+            append_event(session_dir, 'review', {'file': rel_path, 'carried_forward': True,
+                                                 'results': [e for e in carried['ai_results'] if e['file'] == rel_path]})
+    # Linting runs in the background and hands over files one by one; retrieval and review
+    # start on each small chunk of finished files instead of waiting for the whole tree
+    set_session_status(session_dir, 'linting', details)
+    details['lint_cache'] = {'hits': 0, 'misses': 0}
+    ready = queue.Queue()
+    lint_outcome = {}
+    # Its own token, so a failure further down can stop the linters without cancelling the job
+    job_token = current_token()
+    lint_token = job_token.child() if job_token is not None else CancelToken()
+    def lint():
+        reset = activate(lint_token)
+        try:
+            with metrics.stage('lint'):
+                lint_outcome['results'] = run_linters_on_dir(session_dir, lang_map, stats=details['lint_cache'], manifest=review_manifest,
+                                                             on_result=lambda rel_path, issues: ready.put((rel_path, issues)))
+        except Exception as e:
+            lint_outcome['error'] = e
+        finally:
+            deactivate(reset)
+            ready.put(None)
+    # Run under a copy of this context so the job's metrics reach the linters
+    lint_thread = threading.Thread(target=contextvars.copy_context().run, args=(lint,), name='lint', daemon=True)
+    lint_thread.start()
+    try:
+        new_rag_context = {}
+        new_ai_results = []
+        review_stats = new_stats()
+        token_stats = new_token_stats()
+        linting = True
+        while linting:
+            chunk = {}
+            item = ready.get()
+            check_cancelled()
+            while True:
+                if item is None:
+                    linting = False
+                    break
+                rel_path, issues = item
+                chunk[rel_path] = issues
+                append_event(session_dir, 'lint', {'file': rel_path, 'issues': issues})
+                if len(chunk) >= STREAM_CHUNK_FILES:
+                    break
+                try:
+                    item = ready.get_nowait()
+                except queue.Empty:
+                    break
+            # RAG integration
+            if not linting:
+                set_session_status(session_dir, 'retrieving', details)
+            with metrics.stage('rag'):
+                chunk_rag = run_rag_on_linter_results(session_dir, lang_map, chunk, files=files)
+            new_rag_context.update(chunk_rag)
+            # AI review integration
+            if not linting:
+                set_session_status(session_dir, 'reviewing', details)
+            with metrics.stage('ai_review'):
+                chunk_results = run_ai_review_on_rag(session_dir, lang_map, chunk_rag, manifest=manifest, stats=review_stats,
+                                                     files=files, token_stats=token_stats)
+            new_ai_results.extend(chunk_results)
+            for rel_path in chunk:
+                append_event(session_dir, 'review', {'file': rel_path, 'results': [e for e in chunk_results if e['file'] == rel_path]})
+    finally:
+        # Whatever ends the loop, no linter outlives it or keeps reading the session's files
+        lint_token.cancel()
+        lint_thread.join()
+    check_cancelled()
+    if 'error' in lint_outcome:
+        raise lint_outcome['error']
+    linter_results = dict(sorted({**carried['linter_results'], **lint_outcome['results']}.items()))
+    save_linter_results(session_dir, linter_results)
+    rag_context = dict(sorted({**carried['rag_context'], **new_rag_context}.items()))
+    save_rag_context(session_dir, rag_context)
+    # Files finish in any order; findings go back into file order, keeping each file's own order
+    order = {rel_path: i for i, rel_path in enumerate(linter_results)}
+    ai_results = sorted(carried['ai_results'] + new_ai_results, key=lambda entry: order.get(entry['file'], len(order)))
+    details['review_cache'] = finish_stats(review_stats)
+    details['tokens'] = finish_token_stats(token_stats)
+    # Carried-forward files cost nothing this run and are not counted
+    metrics.count('lint_issues', sum(len(issues) for issues in lint_outcome['results'].values()))
+    metrics.count('ai_findings', len(new_ai_results))
+    metrics.record_cache('lint', details['lint_cache']['hits'], details['lint_cache']['misses'])
+    metrics.record_cache('review', review_stats['memory_hits'] + review_stats['disk_hits'] + review_stats['coalesced'],
+                         review_stats['misses'])
+    # Patch/report generation
+    set_session_status(session_dir, 'packaging', details)
+    with metrics.stage('report'):
+        with open(os.path.join(session_dir, 'linter_results.json'), 'r', encoding='utf-8') as f:
+            linter_results = json.load(f)
+        pr_comments = generate_pr_comments(ai_results)
+        score = calculate_code_quality_score(linter_results, ai_results)
+        save_report(session_dir, pr_comments, score)
+        details['patch'] = write_patch_file(session_dir, ai_results, files=files)
+        # Saved after the patch so each entry's patch is the hunk that went into patch.diff
+        save_ai_log(session_dir, ai_results, metadata={'review_cache': details['review_cache'], 'tokens': details['tokens']})
+        write_results_db(session_dir, lang_map, linter_results, ai_results, score, pr_comments)
+
+def _finish(session_dir, session_id, job, key, details):
+    # The download package is built lazily on the first /download request
+    record_alias(job.get('submission_key'), key)
+    if job['type'] == 'github':
+        record_review(job['github_url'], job['commit'], session_dir)
+    set_session_status(session_dir, 'complete', {**details, 'download_url': f'/download/{session_id}'})
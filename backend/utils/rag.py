@@ -1,10 +1,8 @@
 import os
 import json
-import chromadb
-from chromadb.config import Settings
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import FakeEmbeddings
-from langchain.schema import Document
+import threading
+from utils.retriever import build_retriever
+from utils.file_reader import SessionFiles
 
 # Example best practices and bug patterns (can be expanded)
 BEST_PRACTICES = [
@@ -17,49 +15,47 @@ BEST_PRACTICES = [
     {"language": "C", "text": "Check the return value of malloc and free memory properly."},
 ]
 
-# Use a fake embedding for demo; replace with real embeddings for production
-EMBEDDINGS = FakeEmbeddings(size=32)
+# A larger corpus can be loaded from a JSON list of {"language", "text"} entries
+BEST_PRACTICES_PATH = os.getenv('BEST_PRACTICES_PATH')
 
-# ChromaDB settings (use a valid directory)
-CHROMA_SETTINGS = Settings(
-    persist_directory="./chroma_db",
-    anonymized_telemetry=False,
-)
+_retriever = None
+_retriever_lock = threading.Lock()
 
-def initialize_chromadb():
-    client = chromadb.Client(CHROMA_SETTINGS)
-    collection = client.create_collection("best_practices")
-    for idx, item in enumerate(BEST_PRACTICES):
-        collection.add(
-            documents=[item["text"]],
-            metadatas=[{"language": item["language"]}],
-            ids=[str(idx)]
-        )
-    return client, collection
+def load_best_practices():
+    if BEST_PRACTICES_PATH and os.path.exists(BEST_PRACTICES_PATH):
+        with open(BEST_PRACTICES_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return BEST_PRACTICES
 
-def retrieve_best_practices(language, code_snippet, top_k=2):
-    # For demo, just return best practices for the language
-    return [item["text"] for item in BEST_PRACTICES if item["language"] == language][:top_k]
+def get_retriever():
+    # Built once per process and shared by every session
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            _retriever = build_retriever(load_best_practices())
+        return _retriever
 
-# For real RAG, use LangChain Retriever with Chroma and real embeddings
+def _issue_query(issue, source):
+    if not isinstance(issue, dict):
+        return str(issue)
+    code = source.line(issue.get('line')).strip() if source is not None else ''
+    return f"{issue.get('message', '')} {code}"
 
-def run_rag_on_linter_results(directory, lang_map, linter_results):
+def run_rag_on_linter_results(directory, lang_map, linter_results, files=None):
     rag_context = {}
-    for rel_path, issues in linter_results.items():
-        language = lang_map.get(rel_path, "Unknown")
-        file_path = os.path.join(directory, rel_path)
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                code = f.read()
-        except Exception:
-            code = ""
-        rag_context[rel_path] = []
-        for issue in issues:
-            context = retrieve_best_practices(language, code)
-            rag_context[rel_path].append({
-                "issue": issue,
-                "context": context
-            })
+    retriever = get_retriever()
+    session_files = files or SessionFiles(directory)
+    try:
+        for rel_path, issues in linter_results.items():
+            language = lang_map.get(rel_path, "Unknown")
+            with session_files.open(rel_path) as source:
+                queries = [_issue_query(issue, source) for issue in issues]
+            # All of a file's issues are answered by one batched query
+            contexts = retriever.query_batch(language, queries)
+            rag_context[rel_path] = [{"issue": issue, "context": context} for issue, context in zip(issues, contexts)]
+    finally:
+        if files is None:
+            session_files.close()
     return rag_context
 
 def save_rag_context(directory, rag_context):
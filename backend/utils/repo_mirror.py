@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import threading
+from git import Repo
+from git.exc import GitCommandError
+from utils import metrics
+
+MIRROR_DIR = os.getenv('REPO_MIRROR_DIR', os.path.join(tempfile.gettempdir(), 'ai_code_reviewer_mirrors'))
+# file:// URLs are only accepted when this is set (tests, local development)
+ALLOW_LOCAL_REPOS = os.getenv('ALLOW_LOCAL_REPOS', '0') == '1'
+# Mirrors unused for this long, and the least recently used beyond the cap, are deleted
+REPO_MIRROR_TTL_HOURS = float(os.getenv('REPO_MIRROR_TTL_HOURS', 168))
+REPO_MIRROR_MAX = int(os.getenv('REPO_MIRROR_MAX', 100))
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _mirror_lock(key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+def mirror_key(repo_url):
+    return hashlib.sha256(repo_url.rstrip('/').encode('utf-8')).hexdigest()[:24]
+
+def _mirror_path(repo_url):
+    return os.path.join(MIRROR_DIR, mirror_key(repo_url) + '.git')
+
+def _index_path(repo_url):
+    return os.path.join(MIRROR_DIR, mirror_key(repo_url) + '.json')
+
+def fetch_head(repo_url):
+    # Bare mirror per URL, refreshed with a depth-1 fetch of the default branch only
+    os.makedirs(MIRROR_DIR, exist_ok=True)
+    path = _mirror_path(repo_url)
+    with _mirror_lock(mirror_key(repo_url)):
+        if os.path.isdir(path):
+            repo = Repo(path)
+        else:
+            repo = Repo.init(path, bare=True)
+            repo.create_remote('origin', repo_url)
+        metrics.count('subprocesses', tool='git')
+        repo.git.fetch('--depth', '1', '--no-tags', 'origin', 'HEAD')
+        commit = repo.git.rev_parse('FETCH_HEAD')
+        # Keep the fetched head and the last reviewed commit referenced so gc never drops a
+        # commit the next incremental diff needs; older reviewed heads are let go
+        repo.git.update_ref(f'refs/reviewed/{commit}', commit)
+        previous = last_review(repo_url)
+        keep = {commit, previous['commit'] if previous else None}
+        for ref in repo.git.for_each_ref('--format=%(refname)', 'refs/reviewed/').splitlines():
+            if ref.rsplit('/', 1)[-1] not in keep:
+                repo.git.update_ref('-d', ref)
+        repo.git.gc('--auto', '--quiet')
+        # mtime of the mirror directory is its last use
+        os.utime(path)
+    prune_mirrors(keep=mirror_key(repo_url))
+    return commit
+
+def checkout_tree(repo_url, commit, dest_dir):
+    # git archive gives just the working tree: no .git directory, no history
+    # The archive is streamed from git's stdout straight into the destination, never held whole
+    os.makedirs(dest_dir, exist_ok=True)
+    with _mirror_lock(mirror_key(repo_url)):
+        metrics.count('subprocesses', tool='git')
+        proc = Repo(_mirror_path(repo_url)).git.archive(commit, format='tar', as_process=True)
+        try:
+            with tarfile.open(fileobj=proc.stdout, mode='r|') as tar:
+                if hasattr(tarfile, 'data_filter'):
+                    tar.extractall(dest_dir, filter='data')
+                else:
+                    tar.extractall(dest_dir)
+                metrics.count('extracted_bytes', sum(member.size for member in tar.getmembers() if member.isfile()), source='git')
+        except tarfile.TarError:
+            # A failed git archive surfaces as a truncated stream; report git's error instead
+            proc.stdout.close()
+            proc.wait()
+            raise
+        proc.wait()
+
+def changed_files(repo_url, base_commit, commit):
+    # None means the base commit is gone and everything must be reviewed
+    with _mirror_lock(mirror_key(repo_url)):
+        repo = Repo(_mirror_path(repo_url))
+        try:
+            output = repo.git.diff('--name-only', '--no-renames', '--diff-filter=ACMRT', base_commit, commit)
+        except GitCommandError:
+            return None
+    return {os.path.normpath(line) for line in output.splitlines() if line}
+
+def last_review(repo_url):
+    path = _index_path(repo_url)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def record_review(repo_url, commit, session_dir):
+    os.makedirs(MIRROR_DIR, exist_ok=True)
+    path = _index_path(repo_url)
+    fd, tmp_path = tempfile.mkstemp(dir=MIRROR_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'url': repo_url, 'commit': commit, 'session_dir': session_dir}, f)
+    os.replace(tmp_path, path)
+
+def prune_mirrors(keep=None):
+    # Deletes expired mirrors, then the least recently used beyond REPO_MIRROR_MAX, along
+    # with their review index; busy mirrors are skipped
+    try:
+        names = [name for name in os.listdir(MIRROR_DIR) if name.endswith('.git')]
+    except OSError:
+        return
+    mirrors = []
+    for name in names:
+        try:
+            mirrors.append((os.path.getmtime(os.path.join(MIRROR_DIR, name)), name[:-len('.git')]))
+        except OSError:
+            continue
+    mirrors.sort(reverse=True)
+    now = time.time()
+    for rank, (mtime, key) in enumerate(mirrors):
+        if key == keep or (rank < REPO_MIRROR_MAX and now - mtime <= REPO_MIRROR_TTL_HOURS * 3600):
+            continue
+        lock = _mirror_lock(key)
+        if not lock.acquire(blocking=False):
+            continue
+        try:
+            try:
+                os.remove(os.path.join(MIRROR_DIR, key + '.json'))
+            except OSError:
+                pass
+            shutil.rmtree(os.path.join(MIRROR_DIR, key + '.git'), ignore_errors=True)
+        finally:
+            lock.release()
+
+def is_allowed_repo_url(repo_url):
+    return repo_url.startswith('https://github.com/') or (ALLOW_LOCAL_REPOS and repo_url.startswith('file://'))
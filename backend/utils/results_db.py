@@ -0,0 +1,115 @@
+import os
+import re
+import json
+import sqlite3
+
+RESULTS_DB = 'results.db'
+REVIEW_PAGE_SIZE = int(os.getenv('REVIEW_PAGE_SIZE', 100))
+REVIEW_MAX_PAGE_SIZE = int(os.getenv('REVIEW_MAX_PAGE_SIZE', 1000))
+
+_CODE_RE = re.compile(r'^([A-Z]+)(\d*)\b')
+
+def issue_severity(issue):
+    if not isinstance(issue, dict):
+        return 'info'
+    if 'error' in issue:
+        return 'error'
+    if 'info' in issue:
+        return 'info'
+    # eslint reports 2 for errors and 1 for warnings
+    if issue.get('severity') in (1, 2):
+        return 'error' if issue['severity'] == 2 else 'warning'
+    match = _CODE_RE.match(str(issue.get('message', '')))
+    if not match:
+        return 'warning'
+    prefix, number = match.groups()
+    # flake8: F (pyflakes) and E9 (syntax/IO) are real errors; C/N are style advice
+    if prefix == 'F' or (prefix == 'E' and number.startswith('9')):
+        return 'error'
+    if prefix in ('C', 'N'):
+        return 'info'
+    return 'warning'
+
+def db_path(session_dir):
+    return os.path.join(session_dir, RESULTS_DB)
+
+def write_results_db(session_dir, lang_map, linter_results, ai_results, score, pr_comments):
+    # Built under a temporary name and renamed, so readers only ever see a finished database
+    tmp_path = db_path(session_dir) + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript('''
+            CREATE TABLE findings (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                file TEXT NOT NULL,
+                line INTEGER,
+                severity TEXT NOT NULL,
+                language TEXT NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX findings_kind_file ON findings (kind, file);
+            CREATE INDEX findings_kind_severity ON findings (kind, severity);
+            CREATE INDEX findings_kind_language ON findings (kind, language);
+            CREATE TABLE summary (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        ''')
+        rows = []
+        for rel_path, issues in linter_results.items():
+            for issue in issues:
+                rows.append(('lint', rel_path, issue.get('line') if isinstance(issue, dict) else None, issue_severity(issue),
+                             lang_map.get(rel_path, 'Unknown'), json.dumps({'file': rel_path, **issue})))
+        for entry in ai_results:
+            rows.append(('ai', entry['file'], entry.get('line'), issue_severity(entry.get('issue')),
+                         lang_map.get(entry['file'], 'Unknown'), json.dumps(entry)))
+        conn.executemany('INSERT INTO findings (kind, file, line, severity, language, data) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        conn.executemany('INSERT INTO summary (key, value) VALUES (?, ?)', [
+            ('code_quality_score', json.dumps(score)),
+            ('pr_comments', json.dumps(pr_comments)),
+            ('counts', json.dumps({'lint': sum(len(v) for v in linter_results.values()), 'ai': len(ai_results)})),
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path(session_dir))
+
+def _connect(session_dir):
+    return sqlite3.connect(f'file:{db_path(session_dir)}?mode=ro', uri=True)
+
+def read_summary(session_dir):
+    conn = _connect(session_dir)
+    try:
+        return {key: json.loads(value) for key, value in conn.execute('SELECT key, value FROM summary')}
+    finally:
+        conn.close()
+
+def query_findings(session_dir, kind='ai', file=None, severity=None, language=None, offset=0, limit=None, fields=None):
+    limit = min(limit or REVIEW_PAGE_SIZE, REVIEW_MAX_PAGE_SIZE)
+    where = ['kind = ?']
+    params = [kind]
+    if file:
+        where.append('file = ?')
+        params.append(file)
+    if severity:
+        severities = severity.split(',')
+        where.append(f"severity IN ({','.join('?' * len(severities))})")
+        params.extend(severities)
+    if language:
+        where.append('language = ?')
+        params.append(language)
+    clause = ' AND '.join(where)
+    conn = _connect(session_dir)
+    try:
+        total = conn.execute(f'SELECT COUNT(*) FROM findings WHERE {clause}', params).fetchone()[0]
+        rows = conn.execute(f'SELECT data, severity, language FROM findings WHERE {clause} ORDER BY id LIMIT ? OFFSET ?',
+                            params + [limit, offset]).fetchall()
+    finally:
+        conn.close()
+    items = []
+    for data, row_severity, row_language in rows:
+        item = {**json.loads(data), 'severity': row_severity, 'language': row_language}
+        if fields:
+            item = {name: item[name] for name in fields if name in item}
+        items.append(item)
+    return {'total': total, 'offset': offset, 'limit': limit, 'items': items}
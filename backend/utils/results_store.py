@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+RESULTS_STORE_ENABLED = os.getenv('RESULTS_STORE_ENABLED', '1') == '1'
+RESULTS_STORE_DIR = os.getenv('RESULTS_STORE_DIR', os.path.join(tempfile.gettempdir(), 'ai_code_reviewer_cache', 'results'))
+# Entries are whole sessions' artifacts; least recently used ones go once the store outgrows this
+RESULTS_STORE_MAX_MB = int(os.getenv('RESULTS_STORE_MAX_MB', 1024))
+RESULTS_STORE_TTL_HOURS = float(os.getenv('RESULTS_STORE_TTL_HOURS', 168))
+# Bump whenever a pipeline change alters the artifacts for the same input
+PIPELINE_VERSION = '3'
+
+# The manifest is stored for sessions answered without running the pipeline (identical
+# submissions); a pipeline run keeps the one it just built
+STORED_ARTIFACTS = ['file_manifest.json', 'file_languages.json', 'linter_results.json', 'rag_context.json',
+                    'ai_log.json', 'review_report.md', 'patch.diff', 'results.db']
+
+_lock = threading.Lock()
+_inflight_trees = {}
+_inflight_submissions = {}
+_evict_lock = threading.Lock()
+_total_bytes = None
+
+def tree_key(manifest, versions):
+    # Content of every reviewed file plus everything that could change the output for it
+    h = hashlib.sha256()
+    h.update(f'pipeline={PIPELINE_VERSION}\0'.encode())
+    for name, value in sorted(versions.items()):
+        h.update(f'{name}={value}\0'.encode())
+    for rel_path, entry in manifest.items():
+        if not entry['skipped']:
+            h.update(f"{rel_path}\0{entry['sha256']}\0".encode())
+    return h.hexdigest()
+
+def submission_key(*parts):
+    h = hashlib.sha256(f'pipeline={PIPELINE_VERSION}\0'.encode())
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def _entry_dir(key):
+    return os.path.join(RESULTS_STORE_DIR, key[:2], key)
+
+def _alias_path(key):
+    return os.path.join(RESULTS_STORE_DIR, 'aliases', key + '.json')
+
+def _expired(mtime, now=None):
+    return (now or time.time()) - mtime > RESULTS_STORE_TTL_HOURS * 3600
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for fname in files:
+            try:
+                total += os.path.getsize(os.path.join(root, fname))
+            except OSError:
+                pass
+    return total
+
+def _remove_entry(path):
+    # Renamed out of the way first so has_results never sees a half-deleted entry
+    doomed = os.path.join(os.path.dirname(path), '.evicting-' + os.path.basename(path))
+    try:
+        os.rename(path, doomed)
+    except OSError:
+        return False
+    shutil.rmtree(doomed, ignore_errors=True)
+    return True
+
+def has_results(key):
+    if not RESULTS_STORE_ENABLED:
+        return False
+    entry = _entry_dir(key)
+    try:
+        mtime = os.path.getmtime(entry)
+    except OSError:
+        return False
+    if _expired(mtime):
+        _remove_entry(entry)
+        return False
+    return True
+
+def store_results(key, session_dir):
+    global _total_bytes
+    if not RESULTS_STORE_ENABLED or has_results(key):
+        return
+    parent = os.path.dirname(_entry_dir(key))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.staging-')
+    for name in STORED_ARTIFACTS:
+        src = os.path.join(session_dir, name)
+        if os.path.exists(src):
+            shutil.copy2(src, os.path.join(staging, name))
+    size = _dir_size(staging)
+    try:
+        # Rename is atomic, so readers never see a half-copied entry
+        os.rename(staging, _entry_dir(key))
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        return
+    with _evict_lock:
+        if _total_bytes is None:
+            _total_bytes = sum(size for _, size, _ in _list_entries())
+        else:
+            _total_bytes += size
+        if _total_bytes > RESULTS_STORE_MAX_MB * 1024 * 1024:
+            _total_bytes = evict(int(RESULTS_STORE_MAX_MB * 1024 * 1024 * 0.9))
+
+def restore_results(key, session_dir, exclude=()):
+    if not has_results(key):
+        return False
+    entry = _entry_dir(key)
+    try:
+        # Bump mtime so eviction treats the entry as recently used
+        os.utime(entry)
+        for name in os.listdir(entry):
+            if name in exclude:
+                continue
+            shutil.copy2(os.path.join(entry, name), os.path.join(session_dir, name))
+    except OSError:
+        # Evicted mid-copy; the pipeline runs and overwrites whatever was copied
+        return False
+    return True
+
+def _list_entries():
+    # (mtime, bytes, path) of every stored entry
+    entries = []
+    try:
+        shards = [name for name in os.listdir(RESULTS_STORE_DIR) if name != 'aliases']
+    except OSError:
+        return entries
+    for shard in shards:
+        try:
+            names = os.listdir(os.path.join(RESULTS_STORE_DIR, shard))
+        except OSError:
+            continue
+        for name in names:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(RESULTS_STORE_DIR, shard, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            entries.append((mtime, _dir_size(path), path))
+    return entries
+
+def evict(target_bytes):
+    # Expired entries go first, then least recently used until under target; aliases of
+    # removed entries go with them
+    now = time.time()
+    entries = sorted(_list_entries())
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in entries:
+        if total <= target_bytes and not _expired(mtime, now):
+            continue
+        if _remove_entry(path):
+            total -= size
+    prune_aliases()
+    return total
+
+def claim_tree(key):
+    # Returns (event, owner); non-owners wait for the owner's run and then restore its results
+    with _lock:
+        if key in _inflight_trees:
+            return _inflight_trees[key], False
+        event = threading.Event()
+        _inflight_trees[key] = event
+        return event, True
+
+def release_tree(key):
+    with _lock:
+        event = _inflight_trees.pop(key, None)
+    if event is not None:
+        event.set()
+
+def record_alias(sub_key, key):
+    if not RESULTS_STORE_ENABLED or not sub_key:
+        return
+    path = _alias_path(sub_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'tree_key': key}, f)
+    os.replace(tmp_path, path)
+
+def resolve_alias(sub_key):
+    # Tree key of a finished identical submission, if its results are still stored
+    if not RESULTS_STORE_ENABLED:
+        return None
+    path = _alias_path(sub_key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            key = json.load(f)['tree_key']
+    except (OSError, ValueError, KeyError):
+        return None
+    if has_results(key):
+        return key
+    _remove_alias(path)
+    return None
+
+def _remove_alias(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def prune_aliases():
+    # Drops aliases whose entry was evicted (or never stored)
+    directory = os.path.join(RESULTS_STORE_DIR, 'aliases')
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                key = json.load(f)['tree_key']
+        except (OSError, ValueError, KeyError):
+            if not name.endswith('.tmp'):
+                _remove_alias(path)
+            continue
+        if not os.path.isdir(_entry_dir(key)):
+            _remove_alias(path)
+
+def attach_submission(sub_key, session_id):
+    # Returns the session id already working on this exact submission, or registers this one
+    with _lock:
+        if sub_key in _inflight_submissions:
+            return _inflight_submissions[sub_key]
+        _inflight_submissions[sub_key] = session_id
+        return None
+
+def release_submission(sub_key):
+    with _lock:
+        _inflight_submissions.pop(sub_key, None)
@@ -0,0 +1,126 @@
+import os
+import re
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+RETRIEVER_BACKEND = os.getenv('RETRIEVER_BACKEND', 'numpy')  # 'numpy' or 'chroma'
+EMBEDDING_DIM = int(os.getenv('RETRIEVER_EMBEDDING_DIM', 256))
+RETRIEVER_MEMO_SIZE = int(os.getenv('RETRIEVER_MEMO_SIZE', 20000))
+CHROMA_PERSIST_DIR = os.getenv('CHROMA_PERSIST_DIR', './chroma_db')
+
+_TOKEN_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|[=!<>]=+|[^\sA-Za-z0-9_]')
+
+class HashingEmbedder:
+    # Feature-hashed bag of tokens; crc32 keeps vectors stable across processes (hash() is salted)
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN_RE.findall(text.lower()):
+                h = zlib.crc32(token.encode('utf-8'))
+                matrix[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+class _Memo:
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+class NumpyRetriever:
+    # One normalised embedding matrix per language; a query batch is a single matrix multiply
+    def __init__(self, practices, embedder=None):
+        self.embedder = embedder or HashingEmbedder()
+        by_language = {}
+        for item in practices:
+            by_language.setdefault(item['language'], []).append(item['text'])
+        self.texts = by_language
+        self.matrices = {language: self.embedder.embed(texts) for language, texts in by_language.items()}
+
+    def search(self, language, snippets, top_k):
+        matrix = self.matrices.get(language)
+        if matrix is None or not snippets:
+            return [[] for _ in snippets]
+        scores = self.embedder.embed(snippets) @ matrix.T
+        k = min(top_k, matrix.shape[0])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            # Stable tie-break on corpus order keeps results deterministic
+            ordered = sorted(candidates, key=lambda idx: (-scores[row, idx], idx))
+            results.append([self.texts[language][idx] for idx in ordered])
+        return results
+
+class ChromaRetriever:
+    # Optional persistent backend: same embeddings, stored in a Chroma collection built once
+    def __init__(self, practices, embedder=None, persist_dir=CHROMA_PERSIST_DIR):
+        import chromadb
+        self.embedder = embedder or HashingEmbedder()
+        self.client = chromadb.PersistentClient(path=persist_dir)
+        self.collection = self.client.get_or_create_collection('best_practices', metadata={'hnsw:space': 'cosine'})
+        if self.collection.count() != len(practices):
+            ids = [str(idx) for idx in range(len(practices))]
+            self.collection.upsert(
+                ids=ids,
+                documents=[item['text'] for item in practices],
+                metadatas=[{'language': item['language']} for item in practices],
+                embeddings=self.embedder.embed([item['text'] for item in practices]).tolist(),
+            )
+
+    def search(self, language, snippets, top_k):
+        if not snippets:
+            return []
+        found = self.collection.query(query_embeddings=self.embedder.embed(snippets).tolist(),
+                                      n_results=top_k, where={'language': language})
+        return [docs or [] for docs in found.get('documents') or [[] for _ in snippets]]
+
+class Retriever:
+    def __init__(self, backend):
+        self.backend = backend
+        self.memo = _Memo(RETRIEVER_MEMO_SIZE)
+
+    def query_batch(self, language, snippets, top_k=2):
+        # Memoised per (language, snippet hash); only misses reach the index
+        results = [None] * len(snippets)
+        missing = {}
+        for i, snippet in enumerate(snippets):
+            key = (language, top_k, hashlib.sha1(snippet.encode('utf-8')).hexdigest())
+            cached = self.memo.get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            keys = list(missing)
+            found = self.backend.search(language, [snippets[missing[key][0]] for key in keys], top_k)
+            for key, context in zip(keys, found):
+                self.memo.put(key, context)
+                for i in missing[key]:
+                    results[i] = context
+        return results
+
+def build_retriever(practices, backend=None):
+    backend = backend or RETRIEVER_BACKEND
+    if backend == 'chroma':
+        return Retriever(ChromaRetriever(practices))
+    return Retriever(NumpyRetriever(practices))
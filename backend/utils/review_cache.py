@@ -0,0 +1,105 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from utils.disk_cache import DiskCache
+
+REVIEW_CACHE_ENABLED = os.getenv('REVIEW_CACHE_ENABLED', '1') == '1'
+REVIEW_CACHE_DIR = os.getenv('REVIEW_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ai_code_reviewer_cache', 'review'))
+REVIEW_CACHE_MEMORY_ENTRIES = int(os.getenv('REVIEW_CACHE_MEMORY_ENTRIES', 5000))
+REVIEW_CACHE_MAX_MB = int(os.getenv('REVIEW_CACHE_MAX_MB', 256))
+REVIEW_CACHE_TTL_HOURS = float(os.getenv('REVIEW_CACHE_TTL_HOURS', 168))
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def _normalize(text):
+    return _WHITESPACE_RE.sub(' ', str(text)).strip()
+
+def response_key(item, prompt_version):
+    # Location (file, line) is deliberately left out: the same finding on the same code is the same prompt
+    issue = item['issue']
+    message = issue.get('message', str(issue)) if isinstance(issue, dict) else str(issue)
+    parts = [
+        item.get('language', ''),
+        _normalize(message),
+        _normalize(item['code']),
+        _normalize(item['scope']['code']) if item.get('scope') else '',
+        json.dumps([_normalize(c) for c in item.get('best_practices', [])]),
+        prompt_version,
+    ]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+class ReviewCache:
+    def __init__(self, directory=REVIEW_CACHE_DIR, memory_entries=REVIEW_CACHE_MEMORY_ENTRIES,
+                 max_bytes=REVIEW_CACHE_MAX_MB * 1024 * 1024, ttl=REVIEW_CACHE_TTL_HOURS * 3600):
+        self.memory = OrderedDict()
+        self.memory_entries = memory_entries
+        self.disk = DiskCache(directory, max_bytes, ttl=ttl)
+        self.lock = threading.Lock()
+        self.inflight = {}
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key], 'memory'
+        value = self.disk.get(key)
+        if value is not None:
+            self._remember(key, value)
+            return value, 'disk'
+        return None, None
+
+    def _remember(self, key, value):
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def claim(self, key):
+        # Returns (future, owner). Only the owner calls the model; everyone else waits on its future
+        with self.lock:
+            if key in self.inflight:
+                return self.inflight[key], False
+            future = Future()
+            self.inflight[key] = future
+            return future, True
+
+    def resolve(self, key, value):
+        self._remember(key, value)
+        self.disk.put(key, value)
+        with self.lock:
+            future = self.inflight.pop(key, None)
+        if future is not None:
+            future.set_result(value)
+
+    def fail(self, key, error):
+        with self.lock:
+            future = self.inflight.pop(key, None)
+        if future is not None:
+            future.set_exception(error)
+
+def new_stats():
+    return {'memory_hits': 0, 'disk_hits': 0, 'coalesced': 0, 'misses': 0, 'hit_ratio': 0.0}
+
+def finish_stats(stats):
+    served = stats['memory_hits'] + stats['disk_hits'] + stats['coalesced']
+    total = served + stats['misses']
+    stats['hit_ratio'] = round(served / total, 4) if total else 0.0
+    return stats
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_review_cache():
+    global _shared_cache
+    if not REVIEW_CACHE_ENABLED:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ReviewCache()
+        return _shared_cache
@@ -0,0 +1,219 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import requests
+from utils.review_cache import response_key
+from utils.cancellation import current_token, JobCancelled
+from utils.context_packer import prompt_payload, prompt_tokens
+from utils import metrics
+
+AI_REVIEW_URL = os.getenv('AI_REVIEW_URL', '')
+AI_REVIEW_CONCURRENCY = int(os.getenv('AI_REVIEW_CONCURRENCY', 8))
+AI_REVIEW_RATE = float(os.getenv('AI_REVIEW_RATE', 10))  # requests per second, shared by all sessions
+AI_REVIEW_BURST = int(os.getenv('AI_REVIEW_BURST', 10))
+AI_REVIEW_RETRIES = int(os.getenv('AI_REVIEW_RETRIES', 3))
+AI_REVIEW_BACKOFF = float(os.getenv('AI_REVIEW_BACKOFF', 0.5))
+AI_REVIEW_TIMEOUT = float(os.getenv('AI_REVIEW_TIMEOUT', 60))
+AI_REVIEW_BATCH_SIZE = int(os.getenv('AI_REVIEW_BATCH_SIZE', 20))
+PROMPT_VERSION = '2'
+CANCEL_POLL_SECONDS = 0.2
+
+class RetryableReviewError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    # Thread-safe so every session's event loop draws from the same budget
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            wait = self._take()
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+class HTTPReviewBackend:
+    # POST {"prompt_version", "contexts": [{"id", "file", "start_line", "end_line", "code"}], "items": [{..., "context_id"}]}
+    #   -> {"results": [{"suggestion", "recommended_code"}, ...]}, one result per item
+    # Calls go over the network, so they draw from the shared AI_REVIEW_RATE budget
+    rate_limited = True
+
+    def __init__(self, url, timeout=AI_REVIEW_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _post(self, items):
+        try:
+            resp = self.session.post(self.url, json={'prompt_version': PROMPT_VERSION, **prompt_payload(items)}, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise RetryableReviewError(str(e))
+        if resp.status_code == 429 or resp.status_code >= 500:
+            retry_after = resp.headers.get('Retry-After')
+            raise RetryableReviewError(f'Review backend returned {resp.status_code}',
+                                       float(retry_after) if retry_after and retry_after.isdigit() else None)
+        resp.raise_for_status()
+        results = resp.json().get('results', [])
+        if len(results) != len(items):
+            raise RetryableReviewError(f'Review backend returned {len(results)} results for {len(items)} items')
+        return results
+
+    async def review_batch(self, items):
+        return await asyncio.to_thread(self._post, items)
+
+_shared_bucket = TokenBucket(AI_REVIEW_RATE, AI_REVIEW_BURST)
+
+def build_review_record(item, response):
+    code = item['code']
+    recommended_code = response.get('recommended_code', code)
+    return {
+        "file": item['file'],
+        "line": item['line'],
+        "issue": item['issue'],
+        "suggestion": response.get('suggestion', ''),
+        "current_code": code,
+        "recommended_code": recommended_code,
+        # Filled in by write_patch_file, which checks the edit against the whole file
+        "patch": ""
+    }
+
+def _failed_response(item, error):
+    return {'suggestion': f'[AI] Review failed: {error}', 'recommended_code': item['code']}
+
+class ReviewEngine:
+    def __init__(self, backend, concurrency=AI_REVIEW_CONCURRENCY, bucket=None, retries=AI_REVIEW_RETRIES, backoff=AI_REVIEW_BACKOFF,
+                 cache=None, stats=None, token_stats=None):
+        self.backend = backend
+        self.concurrency = concurrency
+        self.bucket = bucket or _shared_bucket
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.stats = stats if stats is not None else {}
+        self.token_stats = token_stats
+
+    def _count(self, name):
+        self.stats[name] = self.stats.get(name, 0) + 1
+
+    async def _review_batch(self, semaphore, items):
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                if getattr(self.backend, 'rate_limited', False):
+                    await self.bucket.acquire()
+                try:
+                    return await self.backend.review_batch(items)
+                except RetryableReviewError as e:
+                    if attempt == self.retries:
+                        raise
+                    delay = e.retry_after if e.retry_after is not None else self.backoff * (2 ** attempt) * (1 + random.random())
+                    logging.warning(f'Review batch failed ({e}); retrying in {delay:.1f}s')
+                    await asyncio.sleep(delay)
+
+    async def _dispatch(self, semaphore, batch, items, keys, responses):
+        # Resolve cache entries per batch so coalesced waiters elsewhere aren't held up by unrelated batches
+        tokens = prompt_tokens([items[i] for i in batch])
+        if self.token_stats is not None:
+            self.token_stats['sent_tokens'] = self.token_stats.get('sent_tokens', 0) + tokens
+        metrics.count('prompt_tokens', tokens)
+        try:
+            outcome = await self._review_batch(semaphore, [items[i] for i in batch])
+        except Exception as e:
+            for i in batch:
+                responses[i] = _failed_response(items[i], e)
+                if i in keys:
+                    self.cache.fail(keys[i], e)
+            return
+        for position, i in enumerate(batch):
+            responses[i] = outcome[position]
+            if i in keys:
+                self.cache.resolve(keys[i], outcome[position])
+
+    @staticmethod
+    async def _cancel_on(token, work):
+        # Requests already handed to a thread finish in the background; their results are dropped
+        while not token.cancelled:
+            await asyncio.sleep(CANCEL_POLL_SECONDS)
+        work.cancel()
+
+    async def review(self, items, batches=None):
+        # batches: packed requests as lists of item indexes (context_packer.pack_items); without them
+        # every issue is its own request
+        semaphore = asyncio.Semaphore(self.concurrency)
+        responses = [None] * len(items)
+        pending = []
+        waiters = []
+        keys = {}
+        for i, item in enumerate(items):
+            if self.cache is None:
+                pending.append(i)
+                continue
+            key = response_key(item, PROMPT_VERSION)
+            value, tier = self.cache.get(key)
+            if value is not None:
+                responses[i] = value
+                self._count(f'{tier}_hits')
+                continue
+            future, owner = self.cache.claim(key)
+            if owner:
+                keys[i] = key
+                pending.append(i)
+                self._count('misses')
+            else:
+                waiters.append((i, future))
+                self._count('coalesced')
+        if batches is None:
+            batches = [[i] for i in pending]
+        else:
+            # Cached and coalesced items drop out of their requests
+            pending = set(pending)
+            batches = [kept for kept in ([i for i in batch if i in pending] for batch in batches) if kept]
+        work = asyncio.gather(*[self._dispatch(semaphore, batch, items, keys, responses) for batch in batches])
+        token = current_token()
+        watcher = asyncio.ensure_future(self._cancel_on(token, work)) if token is not None else None
+        try:
+            await work
+        except asyncio.CancelledError:
+            if token is None or not token.cancelled:
+                raise
+            # Batches cancelled before they ran never failed their claims; coalesced waiters must not hang
+            for i, key in keys.items():
+                if responses[i] is None:
+                    self.cache.fail(key, JobCancelled('Review cancelled'))
+            raise JobCancelled('Review cancelled')
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+        for i, future in waiters:
+            try:
+                responses[i] = await asyncio.wrap_future(future)
+            except Exception as e:
+                responses[i] = _failed_response(items[i], e)
+        # Results go back to their original positions, so output order never depends on timing
+        return [build_review_record(item, response) for item, response in zip(items, responses)]
+
+    def review_sync(self, items, batches=None):
+        if not items:
+            return []
+        return asyncio.run(self.review(items, batches))
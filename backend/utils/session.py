@@ -1,17 +1,298 @@
 import os
 import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from utils.events import append_event, forget_session
+from utils.shared_state import get_state_backend
+from utils.cancellation import current_token
+from utils.metrics import timings_snapshot
+
+SESSIONS_DIR = os.getenv('SESSIONS_DIR', os.path.join(tempfile.gettempdir(), 'ai_code_reviewer_sessions'))
+SESSION_TTL_HOURS = float(os.getenv('SESSION_TTL_HOURS', 24))
+SESSION_DISK_QUOTA_MB = int(os.getenv('SESSION_DISK_QUOTA_MB', 10240))
+SESSION_SWEEP_SECONDS = int(os.getenv('SESSION_SWEEP_SECONDS', 60))
+
+# Only finished sessions are reclaimed for disk quota; running ones just expire if they stop updating
+FINISHED_STATUSES = {'complete', 'error', 'cancelled'}
+
+def _dir_size(path):
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+def _read_status_file(session_dir):
+    # (status data, pid of the process that wrote it); raises OSError/ValueError
+    with open(os.path.join(session_dir, 'status.json'), 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data, data.pop('pid', None)
+
+class SessionManager:
+    def __init__(self, root, ttl=SESSION_TTL_HOURS * 3600, quota_bytes=SESSION_DISK_QUOTA_MB * 1024 * 1024,
+                 sweep_interval=SESSION_SWEEP_SECONDS):
+        self.root = root
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.sweep_interval = sweep_interval
+        # session_id -> {'status', 'data', 'last_access', 'size', 'dirty', 'owned', 'pid'}; owned
+        # sessions had their status written by this process, so the index is always current for them
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _session_id(self, session_dir):
+        if os.path.dirname(os.path.abspath(session_dir)) != os.path.abspath(self.root):
+            return None
+        return os.path.basename(os.path.normpath(session_dir))
+
+    def discover(self):
+        # Index session directories this process hasn't seen (left by a previous run or created by
+        # another process), using status.json's mtime as last access. Returns the new ones.
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            known = set(self._sessions)
+        with os.scandir(self.root) as it:
+            dirs = [entry for entry in it if entry.is_dir(follow_symlinks=False) and entry.name not in known]
+        found = []
+        for entry in dirs:
+            try:
+                last_access = os.stat(os.path.join(entry.path, 'status.json')).st_mtime
+                data, pid = _read_status_file(entry.path)
+            except (OSError, ValueError):
+                try:
+                    last_access = entry.stat(follow_symlinks=False).st_mtime
+                except OSError:
+                    continue
+                data, pid = {'status': 'error', 'error': 'Session status lost.'}, None
+            with self._lock:
+                self._sessions.setdefault(entry.name, {'status': data.get('status'), 'data': data, 'last_access': last_access,
+                                                       'size': _dir_size(entry.path), 'dirty': False,
+                                                       'owned': False, 'pid': pid})
+            found.append((entry.path, data, pid))
+        return found
+
+    def load(self):
+        for session_dir, data, pid in self.discover():
+            if data.get('status') in FINISHED_STATUSES or get_state_backend().shared:
+                continue
+            # The in-memory job queue did not survive the process that ran it. Other live
+            # processes (gunicorn workers sharing the directory) keep their sessions; our own
+            # pid here means a previous run that had it, e.g. pid 1 in a restarted container.
+            if pid is None or pid == os.getpid() or not _process_alive(pid):
+                set_session_status(session_dir, 'error', {'error': 'Review interrupted by a server restart.'})
+
+    def record_status(self, session_dir, data):
+        session_id = self._session_id(session_dir)
+        if session_id is None:
+            return
+        finished = data.get('status') in FINISHED_STATUSES
+        # Finished sessions stop changing, so they are measured once, right away
+        size = _dir_size(session_dir) if finished else None
+        with self._lock:
+            record = self._sessions.setdefault(session_id, {'size': 0, 'dirty': True})
+            record.update({'status': data.get('status'), 'data': data, 'last_access': time.time(),
+                           'owned': True, 'pid': os.getpid()})
+            if size is not None:
+                record['size'] = size
+                record['dirty'] = False
+            else:
+                record['dirty'] = True
+            over_quota = self._total_locked() > self.quota_bytes
+        if over_quota:
+            self._wake.set()
+
+    def status(self, session_dir):
+        session_id = self._session_id(session_dir)
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                return None
+            if record['owned']:
+                return dict(record['data'])
+        return self._refresh(session_id)
+
+    def _refresh(self, session_id):
+        # Another process writes this session's status; status.json is the only current copy
+        session_dir = os.path.join(self.root, session_id)
+        try:
+            data, pid = _read_status_file(session_dir)
+        except FileNotFoundError:
+            with self._lock:
+                self._sessions.pop(session_id, None)
+            return None
+        except (OSError, ValueError):
+            with self._lock:
+                record = self._sessions.get(session_id)
+                return dict(record['data']) if record else None
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is not None and not record['owned']:
+                if data != record['data']:
+                    record.update({'status': data.get('status'), 'data': data, 'pid': pid, 'dirty': True})
+        return dict(data)
+
+    def touch(self, session_dir, resized=False):
+        session_id = self._session_id(session_dir)
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record:
+                record['last_access'] = time.time()
+                record['dirty'] = record['dirty'] or resized
+
+    def usage(self, session_dir):
+        session_id = self._session_id(session_dir)
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if not record:
+                return None
+            return {'disk_usage_bytes': record['size'],
+                    'expires_in_seconds': max(0, int(record['last_access'] + self.ttl - time.time()))}
+
+    def _total_locked(self):
+        return sum(record['size'] for record in self._sessions.values())
+
+    def total_bytes(self):
+        with self._lock:
+            return self._total_locked()
+
+    def remove(self, session_dir):
+        session_id = self._session_id(session_dir)
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        shutil.rmtree(session_dir, ignore_errors=True)
+        forget_session(session_dir)
+        get_state_backend().delete_session(session_id)
+
+    def sweep(self, now=None):
+        now = time.time() if now is None else now
+        self.discover()
+        backend = get_state_backend()
+        if backend.shared:
+            # Sessions finished by worker processes only show up as finished through the backend
+            with self._lock:
+                running = [session_id for session_id, record in self._sessions.items()
+                           if record['status'] not in FINISHED_STATUSES]
+            for session_id in running:
+                data = backend.get_status(session_id)
+                with self._lock:
+                    if data is not None and session_id in self._sessions:
+                        self._sessions[session_id].update({'status': data.get('status'), 'data': data, 'dirty': True})
+        else:
+            # Sessions another Flask process is running only show up as finished in status.json
+            with self._lock:
+                running = [session_id for session_id, record in self._sessions.items()
+                           if not record['owned'] and record['status'] not in FINISHED_STATUSES]
+            for session_id in running:
+                self._refresh(session_id)
+        with self._lock:
+            dirty = [session_id for session_id, record in self._sessions.items() if record['dirty']]
+        for session_id in dirty:
+            size = _dir_size(os.path.join(self.root, session_id))
+            with self._lock:
+                if session_id in self._sessions:
+                    self._sessions[session_id].update({'size': size, 'dirty': False})
+        with self._lock:
+            expired = [session_id for session_id, record in self._sessions.items()
+                       if now - record['last_access'] > self.ttl]
+        for session_id in expired:
+            self.remove(os.path.join(self.root, session_id))
+        reclaimed = []
+        with self._lock:
+            total = self._total_locked()
+            # Least recently accessed finished sessions go first
+            candidates = sorted((record['last_access'], session_id) for session_id, record in self._sessions.items()
+                                if record['status'] in FINISHED_STATUSES)
+            for _, session_id in candidates:
+                if total <= self.quota_bytes:
+                    break
+                total -= self._sessions[session_id]['size']
+                reclaimed.append(session_id)
+        for session_id in reclaimed:
+            self.remove(os.path.join(self.root, session_id))
+        if expired or reclaimed:
+            logging.info(f'Session sweep removed {len(expired)} expired and {len(reclaimed)} over-quota sessions')
+        return {'expired': len(expired), 'reclaimed': len(reclaimed)}
+
+    def _sweep_loop(self):
+        while True:
+            self._wake.wait(self.sweep_interval)
+            self._wake.clear()
+            try:
+                self.sweep()
+            except Exception:
+                logging.exception('Session sweep failed')
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+            self._thread.start()
+
+session_manager = SessionManager(SESSIONS_DIR)
 
 def set_session_status(session_dir, status, extra=None):
+    token = current_token()
+    if token is not None and token.cancelled:
+        # The job was cancelled; its remaining stage updates must not overwrite 'cancelled'
+        return
     status_path = os.path.join(session_dir, 'status.json')
     data = {'status': status}
     if extra:
         data.update(extra)
-    with open(status_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f)
+    # Written by a review job: carry its timing breakdown so far
+    timings = timings_snapshot()
+    if timings is not None:
+        data['timings'] = timings
+    # /status polls this from request threads while a worker rewrites it: write a temp file and
+    # swap it in. The temp file sits next to the session, so it never ends up in the package.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(session_dir)), prefix='.status-', suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        # The writer's pid tells other processes sharing the directory whether the session is still running
+        json.dump({**data, 'pid': os.getpid()}, f)
+    try:
+        os.replace(tmp_path, status_path)
+    except FileNotFoundError:
+        # Session was evicted under a job that was still running
+        os.remove(tmp_path)
+        return
+    session_manager.record_status(session_dir, data)
+    get_state_backend().set_status(os.path.basename(os.path.normpath(session_dir)), data)
+    append_event(session_dir, 'status', data)
 
 def get_session_status(session_dir):
-    status_path = os.path.join(session_dir, 'status.json')
-    if not os.path.exists(status_path):
+    backend = get_state_backend()
+    # With a shared backend the local index only knows what this process wrote
+    data = backend.get_status(os.path.basename(os.path.normpath(session_dir))) if backend.shared else None
+    if data is None:
+        data = session_manager.status(session_dir)
+    if data is not None:
+        return data
+    if not os.path.exists(os.path.join(session_dir, 'status.json')):
         return {'status': 'not found'}
-    with open(status_path, 'r', encoding='utf-8') as f:
-        return json.load(f) 
\ No newline at end of file
+    return _read_status_file(session_dir)[0]
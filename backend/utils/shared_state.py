@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+
+# 'memory' keeps jobs in this process; 'sqlite' shares jobs and session status between processes on one host
+# (or any host that mounts the same SESSIONS_DIR and JOB_DB_PATH)
+JOB_BACKEND = os.getenv('JOB_BACKEND', 'memory')
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join(tempfile.gettempdir(), 'ai_code_reviewer_jobs.db'))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 60))
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', 0.5))
+# Files of priority credit a queued job earns per second of waiting
+JOB_PRIORITY_AGING = float(os.getenv('JOB_PRIORITY_AGING', 10))
+
+def job_priority(job, now):
+    # Smaller submissions first; waiting earns credit so big repos are never starved
+    return job.get('estimated_files', 1) - (now - job['enqueued_at']) * JOB_PRIORITY_AGING
+
+class MemoryBackend:
+    # Jobs die with the process, so there is nothing to lease or re-queue
+    shared = False
+
+    def __init__(self):
+        self._queued = []
+        self._running = {}
+        self._cancelled = set()
+        self._cond = threading.Condition()
+
+    def enqueue(self, job):
+        with self._cond:
+            self._queued.append({**job, 'enqueued_at': time.time()})
+            self._cond.notify()
+
+    def claim(self, worker_id, timeout=1.0):
+        with self._cond:
+            if not self._queued and not self._cond.wait_for(lambda: self._queued, timeout):
+                return None
+            now = time.time()
+            job = min(self._queued, key=lambda queued: job_priority(queued, now))
+            self._queued.remove(job)
+            self._running[job['session_id']] = job
+        return {**job, 'attempt': 1}
+
+    def heartbeat(self, job, worker_id):
+        return True
+
+    def finish(self, job, worker_id):
+        with self._cond:
+            self._running.pop(job['session_id'], None)
+            self._cancelled.discard(job['session_id'])
+
+    def cancel(self, session_id):
+        # (state, job): 'queued' (now dropped), 'running' (its worker has to stop it) or None
+        with self._cond:
+            for job in self._queued:
+                if job['session_id'] == session_id:
+                    self._queued.remove(job)
+                    return 'queued', job
+            if session_id in self._running:
+                self._cancelled.add(session_id)
+                return 'running', self._running[session_id]
+        return None, None
+
+    def is_cancelled(self, job):
+        with self._cond:
+            return job['session_id'] in self._cancelled
+
+    def depth(self):
+        with self._cond:
+            return len(self._queued)
+
+    def active_jobs(self, client=None):
+        with self._cond:
+            jobs = self._queued + list(self._running.values())
+        return sum(1 for job in jobs if client is None or job.get('client') == client)
+
+    def set_status(self, session_id, data):
+        pass
+
+    def get_status(self, session_id):
+        return None
+
+    def delete_session(self, session_id):
+        pass
+
+class SQLiteBackend:
+    # Jobs are leased to a worker and kept alive by heartbeats; a lease that runs out puts the job back in line
+    shared = True
+
+    def __init__(self, path, lease_seconds=JOB_LEASE_SECONDS, poll_interval=JOB_POLL_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                priority REAL NOT NULL DEFAULT 1,
+                client TEXT,
+                cancelled INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS jobs_state_created ON jobs (state, created);
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+        ''')
+        # Job databases created before admission control lack the scheduling columns
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+        for name, definition in (('priority', 'REAL NOT NULL DEFAULT 1'), ('client', 'TEXT'),
+                                 ('cancelled', 'INTEGER NOT NULL DEFAULT 0')):
+            if name not in columns:
+                conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {definition}')
+
+    def _conn(self):
+        # One connection per thread; autocommit, with explicit transactions where claims need them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, job):
+        self._conn().execute('INSERT OR REPLACE INTO jobs (id, payload, state, created, priority, client) VALUES (?, ?, ?, ?, ?, ?)',
+                             (job['session_id'], json.dumps(job), 'queued', time.time(), job.get('estimated_files', 1),
+                              job.get('client')))
+
+    def _try_claim(self, worker_id):
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id, payload, attempts FROM jobs WHERE cancelled = 0 AND (state = 'queued' OR (state = 'running' AND lease_expires < ?)) "
+                'ORDER BY priority - (? - created) * ? LIMIT 1', (now, now, JOB_PRIORITY_AGING)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            job_id, payload, attempts = row
+            conn.execute("UPDATE jobs SET state = 'running', worker = ?, lease_expires = ?, attempts = ? WHERE id = ?",
+                         (worker_id, now + self.lease_seconds, attempts + 1, job_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return {**json.loads(payload), 'attempt': attempts + 1}
+
+    def claim(self, worker_id, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._try_claim(worker_id)
+            if job is not None or time.monotonic() >= deadline:
+                return job
+            time.sleep(self.poll_interval)
+
+    def heartbeat(self, job, worker_id):
+        # False once the lease was lost (expired and taken by another worker)
+        cur = self._conn().execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'running'",
+                                   (time.time() + self.lease_seconds, job['session_id'], worker_id))
+        return cur.rowcount == 1
+
+    def finish(self, job, worker_id):
+        self._conn().execute('DELETE FROM jobs WHERE id = ? AND worker = ?', (job['session_id'], worker_id))
+
+    def cancel(self, session_id):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT state, lease_expires, payload FROM jobs WHERE id = ? AND cancelled = 0', (session_id,)).fetchone()
+            job = json.loads(row[2]) if row else None
+            if row is None:
+                state = None
+            elif row[0] == 'queued' or row[1] < time.time():
+                # Nobody is working on it (a crashed worker's job counts as queued)
+                conn.execute('DELETE FROM jobs WHERE id = ?', (session_id,))
+                state = 'queued'
+            else:
+                conn.execute('UPDATE jobs SET cancelled = 1 WHERE id = ?', (session_id,))
+                state = 'running'
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return state, job
+
+    def is_cancelled(self, job):
+        row = self._conn().execute('SELECT cancelled FROM jobs WHERE id = ?', (job['session_id'],)).fetchone()
+        return bool(row and row[0])
+
+    def depth(self):
+        return self._conn().execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+
+    def active_jobs(self, client=None):
+        if client is None:
+            return self._conn().execute('SELECT COUNT(*) FROM jobs WHERE cancelled = 0').fetchone()[0]
+        return self._conn().execute('SELECT COUNT(*) FROM jobs WHERE cancelled = 0 AND client = ?', (client,)).fetchone()[0]
+
+    def set_status(self, session_id, data):
+        self._conn().execute('INSERT OR REPLACE INTO sessions (id, data, updated) VALUES (?, ?, ?)',
+                             (session_id, json.dumps(data), time.time()))
+
+    def get_status(self, session_id):
+        row = self._conn().execute('SELECT data FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_session(self, session_id):
+        conn = self._conn()
+        conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        conn.execute('DELETE FROM jobs WHERE id = ?', (session_id,))
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_state_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if JOB_BACKEND == 'sqlite':
+                _backend = SQLiteBackend(JOB_DB_PATH)
+            else:
+                _backend = MemoryBackend()
+        return _backend
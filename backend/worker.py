@@ -0,0 +1,51 @@
+import os
+import time
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+
+# Load .env before importing utils so module-level settings pick it up
+load_dotenv()
+
+from utils.jobs import start_workers
+from utils.rag import get_retriever
+from utils.shared_state import get_state_backend
+from utils import metrics
+
+# Separate from REVIEW_WORKERS, which the Flask processes set to 0 when dedicated workers run
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', 2))
+# Serves this process's /metrics for Prometheus; 0 disables it
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 0))
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.registry.render({
+            'review_queue_depth': ('Jobs waiting for a worker.', [({}, get_state_backend().depth())]),
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# Standalone review worker: pulls jobs from the shared backend (JOB_BACKEND=sqlite) and writes
+# artifacts into SESSIONS_DIR, so the Flask processes can run with REVIEW_WORKERS=0.
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if not get_state_backend().shared:
+        raise SystemExit('worker.py needs a shared job backend; set JOB_BACKEND=sqlite')
+    get_retriever()
+    workers = start_workers(WORKER_THREADS)
+    if WORKER_METRICS_PORT:
+        server = ThreadingHTTPServer(('', WORKER_METRICS_PORT), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f'Review worker {os.getpid()} running {len(workers)} threads')
+    while any(t.is_alive() for t in workers):
+        time.sleep(1)
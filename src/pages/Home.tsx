@@ -141,7 +141,7 @@ const Home: React.FC = () => {
         const res = await fetch(`${API_BASE}/status/${id}`);
         const data = await res.json();
         setStatus(data);
-        if (data.status === "complete" || data.status === "not found") {
+        if (data.status === "complete" || data.status === "error" || data.status === "not found") {
           setIsPolling(false);
           if (statusInterval.current) clearInterval(statusInterval.current);
         }